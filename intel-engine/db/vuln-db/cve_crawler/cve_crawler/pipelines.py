@@ -1,11 +1,45 @@
-import sqlite3
+import sqlite3, time
 from pathlib import Path
 
+# cve 已存在时只在 cvss / 描述有变化时更新
+UPSERT_SQL = """
+INSERT INTO vuln(cve, cvss, description, patch_commit, exp_url)
+VALUES (?,?,?,?,?)
+ON CONFLICT(cve) DO UPDATE SET
+    cvss        = excluded.cvss,
+    description = excluded.description
+WHERE vuln.cvss IS NOT excluded.cvss OR vuln.description IS NOT excluded.description
+"""
+
+CPE_SQL = """
+INSERT INTO cpe_match(cve, vendor, product, version_start, start_incl, version_end, end_incl)
+VALUES (?,?,?,?,?,?,?)
+"""
+
 class CvePipeline:
+    """攒 CVE_BATCH_SIZE 条 executemany 一次，每 CVE_COMMIT_EVERY 条提交一次；
+    崩溃最多丢最后一个未提交的区间，upsert 保证重跑幂等。
+    CVE 的 CPE 版本区间写 cpe_match 表，每次整体替换该 CVE 的旧区间"""
+
+    def __init__(self, batch_size=1000, commit_every=20000):
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.buffer = []
+        self.cpe_buffer = []
+        self.uncommitted = 0
+        self.rows = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = crawler.settings
+        return cls(s.getint("CVE_BATCH_SIZE", 1000), s.getint("CVE_COMMIT_EVERY", 20000))
+
     def open_spider(self, spider):
-        DB_PATH = Path(__file__).resolve().parents[3] / "vuln-db" / "std" / "vuln.db"
+        DB_PATH = Path(spider.settings.get("VULN_DB_PATH"))
         DB_PATH.parent.mkdir(parents=True, exist_ok=True)
         self.conn = sqlite3.connect(DB_PATH)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
         self.conn.execute("""
         CREATE TABLE IF NOT EXISTS vuln(
             cve TEXT UNIQUE,
@@ -15,15 +49,65 @@ class CvePipeline:
             exp_url TEXT,
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )""")
+        # 每个 NVD feed 最后一次成功入库时的 sha256
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS feed_meta(
+            feed TEXT PRIMARY KEY,
+            sha256 TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )""")
+        # 受影响的 (vendor, product) 版本区间，起止为 NULL 表示不设限；tools/enrich.py 据此建区间索引
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS cpe_match(
+            cve TEXT,
+            vendor TEXT,
+            product TEXT,
+            version_start TEXT,
+            start_incl INTEGER,
+            version_end TEXT,
+            end_incl INTEGER
+        )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cpe_match_product ON cpe_match(product, vendor)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cpe_match_cve ON cpe_match(cve)")
+        self.conn.commit()
+        self.started = time.monotonic()
+
+    def flush(self):
+        if self.buffer:
+            self.conn.executemany(UPSERT_SQL, self.buffer)
+            self.conn.executemany("DELETE FROM cpe_match WHERE cve = ?", [(b[0],) for b in self.buffer])
+            self.conn.executemany(CPE_SQL, self.cpe_buffer)
+            self.uncommitted += len(self.buffer)
+            self.rows += len(self.buffer)
+            self.buffer.clear()
+            self.cpe_buffer.clear()
+
+    def commit(self):
+        self.flush()
+        self.conn.commit()
+        self.uncommitted = 0
 
     def process_item(self, item, spider):
-        self.conn.execute("""
-        INSERT OR IGNORE INTO vuln(cve, cvss, description, patch_commit, exp_url)
-        VALUES (?,?,?,?,?)
-        """, (item["cve"], item["cvss"], item["description"], item["patch_commit"], item["exp_url"]))
+        if "feed" in item:
+            # feed 结束标记：先提交该 feed 的数据，再记校验和
+            self.commit()
+            self.conn.execute("""
+            INSERT OR REPLACE INTO feed_meta(feed, sha256, updated_at)
+            VALUES (?,?,CURRENT_TIMESTAMP)
+            """, (item["feed"], item["sha256"]))
+            self.conn.commit()
+            return item
+        self.buffer.append((item["cve"], item["cvss"], item["description"], item["patch_commit"], item["exp_url"]))
+        self.cpe_buffer.extend((item["cve"], *r) for r in item.get("cpes", ()))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+            if self.uncommitted >= self.commit_every:
+                self.commit()
         return item
 
     def close_spider(self, spider):
         if hasattr(self, 'conn'):
-            self.conn.commit()
-            self.conn.close()
\ No newline at end of file
+            self.commit()
+            self.conn.close()
+            secs = max(time.monotonic() - self.started, 1e-6)
+            spider.logger.info("CVE 入库 %d 条，用时 %.1fs，%.0f 条/秒", self.rows, secs, self.rows / secs)
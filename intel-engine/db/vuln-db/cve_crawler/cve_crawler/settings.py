@@ -87,5 +87,15 @@ DOWNLOAD_DELAY = 1
 FEED_EXPORT_ENCODING = "utf-8"
 BOT_NAME = "cve_crawler"
 ROBOTSTXT_OBEY = False
-DOWNLOAD_DELAY = 1
-ITEM_PIPELINES = {"cve_crawler.pipelines.CvePipeline": 300}
\ No newline at end of file
+ITEM_PIPELINES = {"cve_crawler.pipelines.CvePipeline": 300}
+
+# 年度 feed 并发下载；单个 zip 几十 MB，调高告警阈值
+CONCURRENT_REQUESTS_PER_DOMAIN = 4
+DOWNLOAD_DELAY = 0
+DOWNLOAD_WARNSIZE = 256 * 1024 * 1024
+
+# 漏洞库：intel-engine/db/vuln-db/std/vuln.db
+from pathlib import Path
+VULN_DB_PATH = str(Path(__file__).resolve().parents[2] / "std" / "vuln.db")
+CVE_BATCH_SIZE = 1000       # 每多少条 executemany 一次
+CVE_COMMIT_EVERY = 20000    # 每多少条提交一次事务
\ No newline at end of file
@@ -1,32 +1,110 @@
-import scrapy, json, sqlite3, datetime, zipfile, io, requests
+import scrapy, sqlite3, datetime, zipfile, io, re, ijson
 from pathlib import Path
 
+FEED_URL = "https://nvd.nist.gov/feeds/json/cve/1.1/nvdcve-1.1-{}.json.{}"
+
 class CveNvdSpider(scrapy.Spider):
+    """
+    -a feeds=recent（默认） | all（2002 至今全部年份） | 2019,2020,modified
+    -a force=1  忽略 .meta 校验和，强制重新入库
+    """
     name = "cve_nvd"
-    start_urls = ["https://nvd.nist.gov/feeds/json/cve/1.1/nvdcve-1.1-recent.json.zip"]
 
-    def parse(self, response):
-        # 下载 zip
+    def __init__(self, feeds="recent", force=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if feeds == "all":
+            self.feeds = [str(y) for y in range(2002, datetime.date.today().year + 1)]
+        else:
+            self.feeds = [f.strip() for f in feeds.split(",") if f.strip()]
+        self.force = bool(force)
+
+    def known_checksums(self):
+        db = Path(self.settings.get("VULN_DB_PATH"))
+        if self.force or not db.exists():
+            return {}
+        with sqlite3.connect(db) as conn:
+            try:
+                return dict(conn.execute("SELECT feed, sha256 FROM feed_meta"))
+            except sqlite3.OperationalError:
+                return {}
+
+    async def start(self):
+        # Scrapy 2.13+ 的入口；新版默认实现不再回落到 start_requests()
+        for req in self.start_requests():
+            yield req
+
+    def start_requests(self):
+        # 先拉几百字节的 .meta，sha256 没变的年份直接跳过
+        known = self.known_checksums()
+        for feed in self.feeds:
+            yield scrapy.Request(FEED_URL.format(feed, "meta"), callback=self.parse_meta,
+                                 cb_kwargs={"feed": feed, "known": known.get(feed)})
+
+    def parse_meta(self, response, feed, known):
+        meta = dict(l.split(":", 1) for l in response.text.splitlines() if ":" in l)
+        sha256 = meta.get("sha256", "").strip()
+        if sha256 and sha256 == known:
+            self.logger.info("feed %s 未变化，跳过", feed)
+            return
+        yield scrapy.Request(FEED_URL.format(feed, "zip"), callback=self.parse,
+                             cb_kwargs={"feed": feed, "sha256": sha256})
+
+    def parse(self, response, feed="recent", sha256=""):
+        # zip 边解压边用 ijson 逐条解析 CVE_Items，内存不随解压后的体积增长
         z = zipfile.ZipFile(io.BytesIO(response.body))
-        json_file = z.namelist()[0]          # nvdcve-1.1-recent.json
-        data = json.loads(z.read(json_file).decode())
-
-        for item in data.get("CVE_Items", []):
-            cve_id = item["cve"]["CVE_data_meta"]["ID"]
-            desc   = next(
-                (d["value"] for d in item["cve"]["description"]["description_data"] if d["lang"] == "en"),
-                ""
-            )
-            cvss   = 0.0
-            if "baseMetricV3" in item.get("impact", {}):
-                cvss = item["impact"]["baseMetricV3"]["cvssV3"]["baseScore"]
-            elif "baseMetricV2" in item.get("impact", {}):
-                cvss = item["impact"]["baseMetricV2"]["cvssV2"]["baseScore"]
-
-            yield {
-                "cve": cve_id,
-                "cvss": cvss,
-                "description": desc,
-                "patch_commit": "",   # 后续任务再补
-                "exp_url": ""
-            }
\ No newline at end of file
+        json_file = z.namelist()[0]          # nvdcve-1.1-<feed>.json
+        count = 0
+        with z.open(json_file) as fp:
+            for item in ijson.items(fp, "CVE_Items.item"):
+                count += 1
+                yield self.to_item(item)
+        self.logger.info("feed %s 解析 %d 条", feed, count)
+
+        # 整个 feed 处理完才记录校验和，中途失败下次会重新拉
+        yield {"feed": feed, "sha256": sha256}
+
+    def to_item(self, item):
+        cve_id = item["cve"]["CVE_data_meta"]["ID"]
+        desc   = next(
+            (d["value"] for d in item["cve"]["description"]["description_data"] if d["lang"] == "en"),
+            ""
+        )
+        cvss   = 0.0
+        if "baseMetricV3" in item.get("impact", {}):
+            cvss = item["impact"]["baseMetricV3"]["cvssV3"]["baseScore"]
+        elif "baseMetricV2" in item.get("impact", {}):
+            cvss = item["impact"]["baseMetricV2"]["cvssV2"]["baseScore"]
+
+        return {
+            "cve": cve_id,
+            "cvss": float(cvss),       # ijson 给的是 Decimal
+            "description": desc,
+            "patch_commit": "",   # 后续任务再补
+            "exp_url": "",
+            "cpes": self.cpe_ranges(item),
+        }
+
+    @staticmethod
+    def cpe_ranges(item):
+        """configurations 里 vulnerable 的 cpe_match → [(vendor, product, 起始版本, 含起点, 截止版本, 含终点)]
+        CPE 自带具体版本时起止都是它；版本为 * / - 且没有 versionStart/End 时表示全部版本（起止为 None）"""
+        out = []
+        stack = list((item.get("configurations") or {}).get("nodes", []))
+        while stack:
+            node = stack.pop()
+            stack.extend(node.get("children", []))
+            for m in node.get("cpe_match", []):
+                if not m.get("vulnerable"):
+                    continue
+                parts = re.split(r"(?<!\\):", m.get("cpe23Uri", ""))   # cpe:2.3:part:vendor:product:version:...
+                if len(parts) < 6:
+                    continue
+                vendor, product, ver = (p.replace("\\", "") for p in parts[3:6])   # 去掉 CPE 转义符
+                if ver not in ("*", "-", ""):
+                    out.append((vendor, product, ver, 1, ver, 1))
+                    continue
+                start = m.get("versionStartIncluding") or m.get("versionStartExcluding")
+                end = m.get("versionEndIncluding") or m.get("versionEndExcluding")
+                out.append((vendor, product, start, int("versionStartIncluding" in m),
+                            end, int("versionEndIncluding" in m)))
+        return list(dict.fromkeys(out))
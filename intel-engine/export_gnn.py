@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+export_gnn.py  -- 把训练好的 GCN 导出成不依赖 torch_geometric 的 TorchScript
+GCNConv 的 lin.weight / bias 原样拷进 Linear，消息传递换成与预先归一化的稀疏邻接做 spmm；
+同时导出一份 int8 动态量化版本
+用法：python export_gnn.py   （train.py 训练结束会自动调用）
+"""
+import pathlib as pl
+import torch
+
+ROOT = pl.Path(__file__).parent / "clean"
+MODEL_PATH = ROOT / "risk_gnn_final.pt"
+FAST_PATH  = ROOT / "risk_gnn_fast.pt"
+INT8_PATH  = ROOT / "risk_gnn_fast_int8.pt"
+
+
+class FastGNN(torch.nn.Module):
+    """与 train.GNN 等价的推理网络（eval 模式下 dropout 为恒等，直接省掉）"""
+    def __init__(self, in_dim=4, hid=64, out=2):
+        super().__init__()
+        self.lin1 = torch.nn.Linear(in_dim, hid, bias=False)
+        self.lin2 = torch.nn.Linear(hid, hid, bias=False)
+        self.lin3 = torch.nn.Linear(hid, out, bias=False)
+        self.b1 = torch.nn.Parameter(torch.zeros(hid))
+        self.b2 = torch.nn.Parameter(torch.zeros(hid))
+        self.b3 = torch.nn.Parameter(torch.zeros(out))
+
+    def forward(self, x, adj):
+        x = torch.relu(torch.sparse.mm(adj, self.lin1(x)) + self.b1)
+        x = torch.relu(torch.sparse.mm(adj, self.lin2(x)) + self.b2)
+        return torch.sparse.mm(adj, self.lin3(x)) + self.b3
+
+    @classmethod
+    def from_state_dict(cls, sd):
+        hid, in_dim = sd["conv1.lin.weight"].shape
+        m = cls(in_dim, hid, sd["conv3.lin.weight"].shape[0])
+        m.load_state_dict({
+            "lin1.weight": sd["conv1.lin.weight"], "b1": sd["conv1.bias"],
+            "lin2.weight": sd["conv2.lin.weight"], "b2": sd["conv2.bias"],
+            "lin3.weight": sd["conv3.lin.weight"], "b3": sd["conv3.bias"],
+        })
+        return m.eval()
+
+
+def export(model_path=MODEL_PATH):
+    m = FastGNN.from_state_dict(torch.load(model_path, map_location="cpu"))
+    torch.jit.save(torch.jit.script(m), FAST_PATH)
+    q = torch.ao.quantization.quantize_dynamic(m, {torch.nn.Linear}, dtype=torch.qint8)
+    torch.jit.save(torch.jit.script(q), INT8_PATH)
+    print(f"✅ 已导出 {FAST_PATH.name} / {INT8_PATH.name}")
+
+
+def load(int8=False, threads=None):
+    """只加载 TorchScript 产物，不 import torch_geometric"""
+    if threads:
+        torch.set_num_threads(threads)
+    fp = INT8_PATH if int8 else FAST_PATH
+    if not fp.exists():
+        raise SystemExit(f"❌ 找不到 {fp.name}，请先运行 python export_gnn.py")
+    return torch.jit.load(fp, map_location="cpu").eval()
+
+
+if __name__ == "__main__":
+    export()
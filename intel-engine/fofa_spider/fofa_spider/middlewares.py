@@ -3,7 +3,9 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import json, re
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
@@ -98,3 +100,122 @@ class FofaSpiderDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+# ---------- FOFA 自适应限流 ----------
+RATE_LIMITED = re.compile(r"too (many|fast)|rate limit|频繁|过快|速度|稍后", re.I)
+QUOTA_EXHAUSTED = re.compile(r"余额不足|F点|次数.*(用完|不足|上限)|quota|exceed", re.I)
+
+
+class FofaThrottleMiddleware:
+    """按 FOFA 的反馈调并发，替代固定的 DOWNLOAD_DELAY（AIMD）：
+    - 连续成功一轮（= 当前并发数个响应）：有延迟先把延迟减半，没有延迟则并发 +1，直到 FOFA_CONCURRENCY_MAX
+    - 429 或「请求过快」类错误：并发减半，已经是 1 时才加延迟；请求放回队列重试（最多 FOFA_RATE_RETRIES 次）。
+      同一批在途请求一起被限流只算一次，避免并发被连续砍到底
+    - 剩余查询次数取自 /info/my，发请求时预扣 1 次（在途请求也算上），限流 / 出错时退回；
+      降到 FOFA_QUOTA_RESERVE 或遇到额度耗尽错误后不再发新请求，剩下的请求走 errback，对应查询不前移同步点"""
+
+    def __init__(self, crawler):
+        s = crawler.settings
+        self.crawler = crawler
+        self.concurrency = s.getint("CONCURRENT_REQUESTS_PER_DOMAIN", 2)
+        self.max_concurrency = s.getint("FOFA_CONCURRENCY_MAX", 16)
+        self.delay = s.getfloat("DOWNLOAD_DELAY", 0)
+        self.max_delay = s.getfloat("FOFA_MAX_DELAY", 30)
+        self.reserve = s.getint("FOFA_QUOTA_RESERVE", 0)
+        self.max_retries = s.getint("FOFA_RATE_RETRIES", 8)
+        self.remain = None          # 剩余 API 查询次数，None = 未知
+        self.streak = 0
+        self.epoch = 0              # 每次降速 +1；降速前发出的请求再被限流不重复降速
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_request(self, request, spider):
+        if "/info/my" in request.url:
+            return None
+        if self.remain is not None:
+            if self.remain <= self.reserve:
+                raise IgnoreRequest(f"FOFA 剩余查询次数 {self.remain}，不再发新请求")
+            self.remain -= 1
+            request.meta["fofa_charged"] = True
+        request.meta["fofa_epoch"] = self.epoch
+        return None
+
+    def refund(self, request):
+        if request.meta.pop("fofa_charged", False) and self.remain is not None:
+            self.remain += 1
+
+    def process_exception(self, request, exception, spider):
+        self.refund(request)
+        return None
+
+    def process_response(self, request, response, spider):
+        if "/info/my" in request.url:
+            info = self.error_body(response, force=True) or {}
+            if "remain_api_query" in info:
+                self.remain = int(info["remain_api_query"])
+                spider.logger.info("FOFA 剩余查询次数 %d，剩余数据量 %s", self.remain, info.get("remain_api_data"))
+            return response
+
+        err = self.error_body(response)
+        msg = (err or {}).get("errmsg", "")
+        if response.status == 429 or (err and RATE_LIMITED.search(msg)):
+            self.refund(request)
+            return self.backoff(request, response, spider)
+        if err and QUOTA_EXHAUSTED.search(msg):
+            if self.remain != 0:
+                spider.logger.error("FOFA 额度耗尽：%s", msg)
+            self.remain = 0
+            return response
+        if response.status != 200 or err:
+            self.refund(request)
+        else:
+            self.streak += 1
+            if self.streak >= self.concurrency:
+                self.streak = 0
+                if self.delay:
+                    self.delay = self.delay / 2 if self.delay > 0.05 else 0.0
+                else:
+                    self.concurrency = min(self.concurrency + 1, self.max_concurrency)
+                self.apply(request)
+        return response
+
+    def backoff(self, request, response, spider):
+        if request.meta.get("fofa_epoch", self.epoch) == self.epoch:
+            self.epoch += 1
+            self.streak = 0
+            if self.concurrency > 1:
+                self.concurrency //= 2
+            else:
+                self.delay = min(max(self.delay * 2, 0.25), self.max_delay)
+            self.apply(request)
+            spider.logger.info("FOFA 限流，并发降到 %d、延迟 %.2fs", self.concurrency, self.delay)
+        retries = request.meta.get("fofa_rate_retries", 0) + 1
+        if retries > self.max_retries:
+            spider.logger.error("FOFA 持续限流，放弃请求（已重试 %d 次）", retries - 1)
+            return response
+        req = request.replace(dont_filter=True)
+        req.meta["fofa_rate_retries"] = retries
+        return req
+
+    def apply(self, request):
+        """把当前并发 / 延迟写进该域名的下载槽（与 AutoThrottle 调整 slot.delay 的方式相同）"""
+        dl = self.crawler.engine.downloader
+        key = dl.get_slot_key(request) if hasattr(dl, "get_slot_key") else dl._get_slot_key(request, None)
+        slot = dl.slots.get(key)
+        if slot is not None:
+            slot.concurrency = self.concurrency
+            slot.delay = self.delay
+
+    @staticmethod
+    def error_body(response, force=False):
+        """只在响应像 FOFA 错误体时才解析 JSON；force=True 时总是解析"""
+        head = response.body[:256]
+        if not force and not re.search(rb'"error"\s*:\s*true', head):
+            return None
+        try:
+            return json.loads(response.body)
+        except ValueError:
+            return None
@@ -1,13 +1,51 @@
-import sqlite3, datetime, os
+import sqlite3, datetime, time
 from itemadapter import ItemAdapter
+from twisted.internet import task
 
-DB_PATH = r"D:\pythonProject1\intel-engine\intel.db"
+# 已存在的 (ip, port) 刷新字段和 last_seen；新值为空时保留旧值
+UPSERT_SQL = """
+    INSERT INTO assets
+    (ip, port, protocol, host, title, banner, icp, country, city, framework, last_seen)
+    VALUES (?,?,?,?,?,?,?,?,?,?,?)
+    ON CONFLICT(ip, port) DO UPDATE SET
+        protocol  = COALESCE(excluded.protocol,  assets.protocol),
+        host      = COALESCE(excluded.host,      assets.host),
+        title     = COALESCE(excluded.title,     assets.title),
+        banner    = COALESCE(excluded.banner,    assets.banner),
+        icp       = COALESCE(excluded.icp,       assets.icp),
+        country   = COALESCE(excluded.country,   assets.country),
+        city      = COALESCE(excluded.city,      assets.city),
+        framework = COALESCE(excluded.framework, assets.framework),
+        last_seen = excluded.last_seen
+"""
 
 class SQLitePipeline:
+    """攒批入库：满 SQLITE_BATCH_SIZE 条或距上次落盘超过 SQLITE_FLUSH_INTERVAL 秒时，
+    一个事务 executemany 写入；close_spider 时写完剩余"""
+
+    def __init__(self, db_path, batch_size=500, flush_interval=5.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = crawler.settings
+        return cls(
+            s.get("SQLITE_DB_PATH"),
+            s.getint("SQLITE_BATCH_SIZE", 500),
+            s.getfloat("SQLITE_FLUSH_INTERVAL", 5.0),
+        )
+
     def open_spider(self, spider):
-        self.conn = sqlite3.connect(DB_PATH)
-        self.cur  = self.conn.cursor()
-        self.cur.execute("""
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-65536")      # 64 MB
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute("""
             CREATE TABLE IF NOT EXISTS assets(
                 ip        TEXT,
                 port      INTEGER,
@@ -23,20 +61,48 @@ class SQLitePipeline:
                 UNIQUE(ip, port)
             )
         """)
+        self.migrate()
         self.conn.commit()
+        self.last_flush = time.monotonic()
+        # 空闲时也按时间阈值落盘，避免零散的尾巴一直留在内存里
+        self.timer = task.LoopingCall(self.flush)
+        self.timer.start(self.flush_interval, now=False)
+
+    def migrate(self):
+        """recon.py 建的 assets 表缺爬虫的几列，旧库也可能没有 (ip, port) 唯一约束：补列，去重后补唯一索引；
+        必须在第一次 flush 之前跑完，否则 UPSERT_SQL 的列和 ON CONFLICT(ip, port) 都会报错"""
+        have = {r[1] for r in self.conn.execute("PRAGMA table_info(assets)")}
+        for col, typ in (("icp", "TEXT"), ("country", "TEXT"), ("city", "TEXT"),
+                         ("framework", "TEXT"), ("last_seen", "DATETIME")):
+            if col not in have:
+                self.conn.execute(f"ALTER TABLE assets ADD COLUMN {col} {typ}")
+        if "last_seen" not in have and "timestamp" in have:
+            # recon.py 写入的旧资产只有 timestamp，拿它当 last_seen，看板按最近出现筛选时不会被漏掉
+            self.conn.execute("UPDATE assets SET last_seen = timestamp WHERE last_seen IS NULL")
+        for _, name, unique, *_ in self.conn.execute("PRAGMA index_list(assets)").fetchall():
+            if unique and [r[2] for r in self.conn.execute(f"PRAGMA index_info({name})")] == ["ip", "port"]:
+                return
+        self.conn.execute("DELETE FROM assets WHERE rowid NOT IN (SELECT MAX(rowid) FROM assets GROUP BY ip, port)")
+        self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_assets_ip_port ON assets(ip, port)")
 
     def close_spider(self, spider):
+        if self.timer.running:
+            self.timer.stop()
+        self.flush()
         self.conn.close()
 
+    def flush(self):
+        if self.buffer:
+            with self.conn:
+                self.conn.executemany(UPSERT_SQL, self.buffer)
+            self.buffer.clear()
+        self.last_flush = time.monotonic()
+
     def process_item(self, item, spider):
         adapter = ItemAdapter(item)
-        text = (adapter.get("banner", "") + " " + adapter.get("server", "")).lower()
+        text = ((adapter.get("banner") or "") + " " + (adapter.get("server") or "")).lower()
         framework = spider.extract_framework(text)
-        self.cur.execute("""
-            INSERT OR IGNORE INTO assets
-            (ip, port, protocol, host, title, banner, icp, country, city, framework, last_seen)
-            VALUES (?,?,?,?,?,?,?,?,?,?,?)
-        """, (
+        self.buffer.append((
             adapter["ip"],
             int(adapter["port"]),
             adapter["protocol"],
@@ -49,5 +115,6 @@ class SQLitePipeline:
             framework,
             datetime.datetime.utcnow().isoformat(timespec="seconds")
         ))
-        self.conn.commit()
-        return item
\ No newline at end of file
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+        return item
@@ -22,9 +22,10 @@ ADDONS = {}
 ROBOTSTXT_OBEY = True
 
 # Concurrency and throttling settings
+# 并发 / 延迟不再写死：FofaThrottleMiddleware 从 CONCURRENT_REQUESTS_PER_DOMAIN 起步按 FOFA 的反馈调整
 #CONCURRENT_REQUESTS = 16
-CONCURRENT_REQUESTS_PER_DOMAIN = 1
-DOWNLOAD_DELAY = 1
+CONCURRENT_REQUESTS_PER_DOMAIN = 2
+DOWNLOAD_DELAY = 0
 
 # Disable cookies (enabled by default)
 #COOKIES_ENABLED = False
@@ -49,6 +50,10 @@ DOWNLOAD_DELAY = 1
 #DOWNLOADER_MIDDLEWARES = {
 #    "fofa_spider.middlewares.FofaSpiderDownloaderMiddleware": 543,
 #}
+# 排在 RetryMiddleware(550) 之后、离下载器更近，429 先由它退避重试
+DOWNLOADER_MIDDLEWARES = {
+    "fofa_spider.middlewares.FofaThrottleMiddleware": 560,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
@@ -89,14 +94,27 @@ BOT_NAME = "fofa_spider"
 USER_AGENT = "Mozilla/5.0 (compatible; FOFA-Spider/1.0)"
 
 ROBOTSTXT_OBEY = False
-CONCURRENT_REQUESTS = 8
-DOWNLOAD_DELAY = 1
+CONCURRENT_REQUESTS = 32
 
 ITEM_PIPELINES = {
     "fofa_spider.pipelines.SQLitePipeline": 300,
 }
 
-# FOFA 账号邮箱 + API KEY
 import os
+from pathlib import Path
+
+# SQLite 入库：默认写 intel-engine/intel.db，可用环境变量 INTEL_DB 覆盖
+SQLITE_DB_PATH = os.getenv("INTEL_DB", str(Path(__file__).resolve().parents[2] / "intel.db"))
+SQLITE_BATCH_SIZE = 500        # 攒满多少条写一次
+SQLITE_FLUSH_INTERVAL = 5      # 最多攒多少秒写一次
+FOFA_SYNC_FLOOR = "2015-01-01"  # -a delta=1 首次同步的起始日期
+
+# FofaThrottleMiddleware：成功一轮并发 +1，限流时减半
+FOFA_CONCURRENCY_MAX = 16      # 单域名并发上限
+FOFA_MAX_DELAY = 30            # 限流退避时的最大请求间隔（秒）
+FOFA_RATE_RETRIES = 8          # 单个请求因限流最多重试几次
+FOFA_QUOTA_RESERVE = 0         # 剩余查询次数降到多少就停止发新请求
+
+# FOFA 账号邮箱 + API KEY
 FOFA_EMAIL = os.getenv("FOFA_EMAIL", "").strip()
 FOFA_KEY   = os.getenv("FOFA_KEY", "").strip()
\ No newline at end of file
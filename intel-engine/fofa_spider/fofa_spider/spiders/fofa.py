@@ -1,12 +1,26 @@
-import scrapy, base64, re, os
+import scrapy, base64, re, os, sqlite3, datetime, math
+from scrapy.exceptions import IgnoreRequest
 from fofa_spider.items import AssetItem
 
+FOFA_API = "https://fofa.info/api/v1/search/all"
+FOFA_INFO = "https://fofa.info/api/v1/info/my"
+FIELDS = "ip,port,protocol,host,title,icp,country,city,server,banner"
+
 class FofaSpider(scrapy.Spider):
+    """
+    -a query=xxx  -a size=xxx（每页条数）
+    -a queries=queries.txt   一行一条查询，# 开头为注释
+    -a query_table=fofa_queries   从 intel.db 的表里读 query 列（有 enabled 列时只取 enabled=1）
+    -a delta=1    增量同步：每条查询只拉 fofa_sync 记录的上次同步日期之后更新的资产（与 recon.py --delta 共用同步点），
+                  窗口结果数超过 -a cap（默认 10000）时二分时间窗；全部成功的查询才在 closed() 里前移同步点
+    每条查询都翻页拉到 cap 为止；并发与延迟由 FofaThrottleMiddleware 按 FOFA 的限流 / 剩余额度动态调整
+    """
     name = "fofa"
     allowed_domains = ["fofa.info"]
 
     query = 'protocol="http"'   # 默认查询，可 -a query=xxx 覆盖
-    size  = 50               # 可 -a size=xxx 覆盖
+    size  = 50               # 可 -a size=xxx 覆盖；增量模式下为每页条数
+    cap   = 10000            # 单个查询最多能翻到的条数
 
     # 框架指纹正则
     FRAMEWORK_PATTERN = re.compile(
@@ -14,29 +28,120 @@ class FofaSpider(scrapy.Spider):
         re.I
     )
 
-    def __init__(self, email=None, key=None, query=None, size=None, *args, **kwargs):
+    def __init__(self, email=None, key=None, query=None, size=None, delta=None, cap=None,
+                 queries=None, query_table=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.email = email or os.getenv("FOFA_EMAIL", "").strip()
         self.key   = key   or os.getenv("FOFA_KEY", "").strip()
         if query: self.query = query
         if size:  self.size  = int(size)
+        if cap:   self.cap   = int(cap)
+        self.queries_file = queries
+        self.query_table = query_table
+        self.delta = bool(delta)
+        self.queries = []
+        self.failed = set()          # 出过错的查询，closed() 里不前移它们的同步点
+        self.today = datetime.date.today()
         if not self.email or not self.key:
             raise ValueError("FOFA_EMAIL / FOFA_KEY 缺失")
 
-    def start_requests(self):
-        qbase64 = base64.b64encode(self.query.encode()).decode()
+    def load_queries(self):
+        if self.queries_file:
+            with open(self.queries_file, encoding="utf-8") as f:
+                qs = [l.strip() for l in f if l.strip() and not l.lstrip().startswith("#")]
+        elif self.query_table:
+            with sqlite3.connect(self.settings.get("SQLITE_DB_PATH")) as conn:
+                cols = {r[1] for r in conn.execute(f"PRAGMA table_info({self.query_table})")}
+                where = " WHERE enabled = 1" if "enabled" in cols else ""
+                qs = [r[0] for r in conn.execute(f"SELECT query FROM {self.query_table}{where}") if r[0]]
+        else:
+            qs = [self.query]
+        return list(dict.fromkeys(qs))
+
+    def api_request(self, base, query, page=1, **meta):
+        qbase64 = base64.b64encode(query.encode()).decode()
         url = (
-            f"https://fofa.info/api/v1/search/all"
+            f"{FOFA_API}"
             f"?email={self.email}&key={self.key}&qbase64={qbase64}"
-            f"&size={self.size}&fields=ip,port,protocol,host,title,icp,country,city,server,banner"
+            f"&size={self.size}&page={page}&fields={FIELDS}"
         )
-        yield scrapy.Request(url, callback=self.parse)
+        # 翻页请求优先，已经开始的查询先拉完，同步点能尽早落定
+        return scrapy.Request(url, callback=self.parse, errback=self.on_error, priority=1 if page > 1 else 0,
+                              meta={"base": base, "query": query, "page": page, **meta})
+
+    async def start(self):
+        # Scrapy 2.13+ 的入口；新版默认实现不再回落到 start_requests()
+        for req in self.start_requests():
+            yield req
+
+    def start_requests(self):
+        # 先查剩余额度，拿到后再发查询请求，限流中间件据此控制总请求数；查不到额度也照常开始
+        yield scrapy.Request(f"{FOFA_INFO}?email={self.email}&key={self.key}", callback=self.parse_info,
+                             errback=self.query_requests, dont_filter=True)
+
+    def parse_info(self, response):
+        # 剩余额度已由 FofaThrottleMiddleware 解析记录
+        return self.query_requests()
+
+    def query_requests(self, failure=None):
+        self.queries = self.load_queries()
+        self.logger.info("共 %d 条查询%s", len(self.queries), "（增量同步）" if self.delta else "")
+        synced = self.synced_until() if self.delta else {}
+        floor = self.settings.get("FOFA_SYNC_FLOOR", "2015-01-01")
+        for q in self.queries:
+            if not self.delta:
+                yield self.api_request(q, q)
+                continue
+            # 回退一天：after 可能不含当天，上次同步当天稍晚更新的资产也能补上
+            start = datetime.date.fromisoformat(synced.get(q, floor)) - datetime.timedelta(days=1)
+            yield self.window_request(q, start, self.today + datetime.timedelta(days=1))
+
+    # ---------- 增量同步 ----------
+    def sync_db(self):
+        conn = sqlite3.connect(self.settings.get("SQLITE_DB_PATH"))
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS fofa_sync(
+                query        TEXT PRIMARY KEY,
+                synced_until DATE,
+                updated_at   DATETIME DEFAULT CURRENT_TIMESTAMP
+            )""")
+        return conn
+
+    def synced_until(self):
+        """{查询: 上次同步日期}"""
+        with self.sync_db() as conn:
+            return dict(conn.execute("SELECT query, synced_until FROM fofa_sync"))
+
+    def window_request(self, base, after, before):
+        q = f'({base}) && after="{after.isoformat()}" && before="{before.isoformat()}"'
+        return self.api_request(base, q, window=(after, before))
+
+    def split_window(self, after, before):
+        """二分时间窗；FOFA 的 after / before 只到天，两半各多盖一天，边界那天不会漏（重复的按 (ip, port) 合并）"""
+        mid = after + (before - after) / 2
+        return [(after, mid + datetime.timedelta(days=1)), (mid, before)]
 
     def parse(self, response):
+        base = response.meta["base"]
         data = response.json()
         if data.get("error"):
-            self.logger.error("FOFA API 错误: %s", data.get("errmsg"))
+            self.logger.error("FOFA API 错误（%s）: %s", base, data.get("errmsg"))
+            self.failed.add(base)
             return
+        window = response.meta.get("window")
+        if response.meta["page"] == 1:
+            total = int(data.get("size") or 0)
+            after, before = window or (None, None)
+            if window and total > self.cap and (before - after).days > 2:
+                # 超过翻页上限：第 1 页的结果子窗口会重新拉到，这里直接丢弃
+                for a, b in self.split_window(after, before):
+                    yield self.window_request(base, a, b)
+                return
+            if total > self.cap:
+                self.logger.warning("%s %s~%s 共 %d 条，超过单查询上限 %d，只能拉前 %d 条",
+                                    base, after or "", before or "", total, self.cap, self.cap)
+            for page in range(2, math.ceil(min(total, self.cap) / self.size) + 1):
+                yield self.api_request(base, response.meta["query"], page)
         for row in data.get("results", []):
             yield AssetItem(
                 ip       = row[0],
@@ -51,6 +156,29 @@ class FofaSpider(scrapy.Spider):
                 banner   = row[9],
             )
 
+    def on_error(self, failure):
+        base = failure.request.meta.get("base")
+        # 额度不足时限流中间件会丢掉剩余请求，逐条打 error 没有意义
+        log = self.logger.debug if failure.check(IgnoreRequest) else self.logger.error
+        log("FOFA 请求失败（%s）: %s", base, failure.getErrorMessage())
+        if base:
+            self.failed.add(base)
+
+    def closed(self, reason):
+        if not self.delta:
+            return
+        if reason != "finished":
+            self.logger.warning("增量同步中断（%s），同步点不前移，下次重拉", reason)
+            return
+        done = [q for q in self.queries if q not in self.failed]
+        with self.sync_db() as conn:
+            conn.executemany("""
+                INSERT INTO fofa_sync(query, synced_until, updated_at) VALUES (?,?,CURRENT_TIMESTAMP)
+                ON CONFLICT(query) DO UPDATE SET synced_until=excluded.synced_until, updated_at=excluded.updated_at
+            """, [(q, self.today.isoformat()) for q in done])
+        self.logger.info("增量同步完成 %d 条查询，同步点前移到 %s；%d 条出错，下次重拉",
+                         len(done), self.today, len(self.failed))
+
     def extract_framework(self, text):
         m = self.FRAMEWORK_PATTERN.search(text)
-        return m.group(1).lower() if m else None
\ No newline at end of file
+        return m.group(1).lower() if m else None
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+graph_features.py  -- train.py / predict.py 共用的建图与特征编码
+同一份输入（内容哈希）+ 同一套词表的建图结果缓存在 clean/graph_cache/（只留最近 CACHE_KEEP 组），
+训练词表存到 clean/risk_gnn_vocab.json，推理时沿用，保证特征编号一致
+"""
+import hashlib, json, socket, pathlib as pl
+import numpy as np
+import torch
+
+ROOT = pl.Path(__file__).parent / "clean"
+CACHE_DIR  = ROOT / "graph_cache"
+VOCAB_PATH = ROOT / "risk_gnn_vocab.json"
+
+SEVERITIES    = ["critical", "high", "medium", "low", "info", "unknown"]
+DEFAULT_SCORE = 0.218
+DEFAULT_PORT  = 8983
+FEATURE_VERSION = 1     # 特征定义变化时递增，旧缓存自动失效
+CACHE_KEEP = 4          # graph_cache 最多保留几组（训练词表 / 推理词表各占一组），超出的按最近使用时间淘汰
+
+
+# ---------- utils ----------
+def load_json(fp):
+    raw = json.load(open(fp, encoding="utf-8"))
+    return json.loads(raw) if isinstance(raw, str) else (raw if isinstance(raw, list) else [raw])
+
+def pack_ipv4(ips) -> np.ndarray:
+    """IPv4 字符串 → int64 数组，非 IPv4 记为 -1"""
+    out = []
+    for ip in ips:
+        try:
+            out.append(int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big"))
+        except (OSError, TypeError):
+            out.append(-1)
+    return np.asarray(out, dtype=np.int64)
+
+def subnet_edges(packed: np.ndarray, prefix: int = 24, undirected: bool = False) -> np.ndarray:
+    """同一前缀（/16、/24、/28 …）内的节点两两连边，返回 [2, E] 的节点下标，不含自环。
+    排序后按前缀分组，组内 i<j 的全部点对用 repeat/cumsum 一次性展开，不做逐对比较"""
+    if not 0 < prefix <= 32:
+        raise ValueError(f"prefix 必须在 1..32 之间: {prefix}")
+    idx = np.flatnonzero(packed >= 0)
+    key = packed[idx] >> (32 - prefix)
+    order = np.argsort(key, kind="stable")
+    idx, key = idx[order], key[order]
+
+    _, start, count = np.unique(key, return_index=True, return_counts=True)
+    pos = np.arange(len(idx))
+    fan = np.repeat(start + count, count) - pos - 1          # 每个位置连向组内后面的节点数
+    src = np.repeat(pos, fan)
+    dst = src + np.arange(fan.sum()) - np.repeat(np.cumsum(fan) - fan, fan) + 1
+
+    edges = np.stack([idx[src], idx[dst]])
+    if undirected:
+        edges = np.concatenate([edges, edges[::-1]], axis=1)
+    return edges
+
+def lookup(values, table, default):
+    """对 unique 值查表后按 inverse 回填，Python 循环只跑在去重后的取值上"""
+    uniq, inv = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+    return np.asarray([table.get(u, default) for u in uniq], dtype=np.float32)[inv]
+
+
+# ---------- 特征 ----------
+def node_columns(records):
+    """每个 IP 一个节点（同 IP 以最后一条记录为准），返回列式数据"""
+    info = {}
+    for r in records:
+        if isinstance(r, dict):
+            host  = r.get("host") or r.get("matched-at") or "0.0.0.0:0"
+            sev   = (r.get("severity") or "unknown").lower()
+            score = ((r.get("info") or {}).get("classification") or {}).get("cvss-score", DEFAULT_SCORE)
+            tmpl  = r.get("template-id") or "unknown"
+        else:
+            host, sev, score, tmpl = str(r), "unknown", DEFAULT_SCORE, "unknown"
+        ip, _, port = host.partition(":")
+        info[ip] = (int(port) if port.isdigit() else DEFAULT_PORT, sev, float(score or 0), tmpl)
+
+    ips = list(info)
+    ports, sevs, scores, tmpls = zip(*info.values()) if info else ((), (), (), ())
+    return ips, np.asarray(ports, dtype=np.float32), list(sevs), np.asarray(scores, dtype=np.float32), list(tmpls)
+
+def build_vocab(tmpls):
+    return {"sev2id": {s: i for i, s in enumerate(SEVERITIES)},
+            "tmpl2id": {t: i for i, t in enumerate(sorted(set(tmpls)))}}
+
+def build(records, vocab=None, prefix=24):
+    """records → {x, y, edge_index, nodes, vocab}；vocab 为 None 时按输入新建（训练）"""
+    ips, ports, sevs, scores, tmpls = node_columns(records)
+    vocab = vocab or build_vocab(tmpls)
+    sev2id, tmpl2id = vocab["sev2id"], vocab["tmpl2id"]
+
+    sev_id  = lookup(sevs, sev2id, sev2id["unknown"])
+    tmpl_id = lookup(tmpls, tmpl2id, len(tmpl2id))          # 训练时没见过的模板统一编成 len(vocab)
+    # 特征：cvss-score, port/65535, sev_embed, tmpl_embed
+    x = np.column_stack([scores, ports / 65535.0, sev_id, tmpl_id]).astype(np.float32).reshape(-1, 4)
+    y = (sev_id <= sev2id["high"]).astype(np.int64)           # critical / high 为正样本
+
+    # 边：同 /24 子网互联，双向
+    edges = subnet_edges(pack_ipv4(ips), prefix, undirected=True)
+    return {
+        "x": torch.from_numpy(x),
+        "y": torch.from_numpy(y),
+        "edge_index": torch.from_numpy(edges),
+        "nodes": ips,
+        "vocab": vocab,
+    }
+
+def norm_adj(edge_index, n):
+    """GCNConv 默认的归一化邻接 D^-1/2 (A+I) D^-1/2，CSR 稀疏矩阵，供不依赖 PyG 的推理快路径做 spmm"""
+    loops = torch.arange(n)
+    row = torch.cat([edge_index[1], loops])             # 目标节点
+    col = torch.cat([edge_index[0], loops])             # 源节点
+    dinv = torch.bincount(row, minlength=n).float().pow(-0.5)
+    adj = torch.sparse_coo_tensor(torch.stack([row, col]), dinv[row] * dinv[col], (n, n))
+    return adj.coalesce().to_sparse_csr()
+
+def to_data(g):
+    from torch_geometric.data import Data
+    return Data(x=g["x"], y=g["y"], edge_index=g["edge_index"])
+
+
+# ---------- 缓存 ----------
+def cache_key(json_file, vocab=None):
+    h = hashlib.sha256(f"v{FEATURE_VERSION}".encode())
+    with open(json_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    h.update(json.dumps(vocab, sort_keys=True).encode())
+    return h.hexdigest()[:24]
+
+def cache_hit(fp):
+    if not fp.exists():
+        return None
+    fp.touch()                     # 刷新 mtime，淘汰时按最近使用算
+    return torch.load(fp, weights_only=True)
+
+def cache_put(fp, obj, keep=CACHE_KEEP):
+    """写入缓存并淘汰最久未用的旧条目（<hash>.pt 与 <hash>.adj.pt 算一组），每天的新输入不会让目录无限增长"""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    torch.save(obj, fp)
+    used = {}
+    for f in CACHE_DIR.glob("*.pt"):
+        key = f.name.split(".", 1)[0]
+        used[key] = max(used.get(key, 0), f.stat().st_mtime)
+    for key in sorted(used, key=used.get, reverse=True)[keep:]:
+        for f in CACHE_DIR.glob(f"{key}.*"):
+            f.unlink(missing_ok=True)
+
+def load_graph(json_file, vocab=None):
+    """带缓存的建图：输入文件内容与词表都没变时直接读 clean/graph_cache/<hash>.pt"""
+    fp = CACHE_DIR / f"{cache_key(json_file, vocab)}.pt"
+    g = cache_hit(fp)
+    if g is None:
+        g = build(load_json(json_file), vocab)
+        cache_put(fp, g)
+    return g
+
+def load_adj(json_file, vocab=None):
+    """推理快路径用的 {x, nodes, adj}：不带 edge_index，归一化邻接预先算好，缓存为 <hash>.adj.pt"""
+    fp = CACHE_DIR / f"{cache_key(json_file, vocab)}.adj.pt"
+    a = cache_hit(fp)
+    if a is None:
+        g = load_graph(json_file, vocab)
+        a = {"x": g["x"], "nodes": g["nodes"], "adj": norm_adj(g["edge_index"], len(g["nodes"]))}
+        cache_put(fp, a)
+    return a
+
+def save_vocab(vocab, fp=VOCAB_PATH):
+    fp.write_text(json.dumps(vocab, ensure_ascii=False, indent=2), encoding="utf-8")
+
+def load_vocab(fp=VOCAB_PATH):
+    return json.loads(fp.read_text(encoding="utf-8")) if fp.exists() else None
@@ -1,8 +1,26 @@
 from abc import ABC, abstractmethod
 
 class POCBase(ABC):
-    """所有 PoC 必须实现 verify 方法"""
+    """所有 PoC 必须实现 verify 方法
+    runner 会注入共享连接池的 self.session（requests.Session，已带默认超时），插件直接用它发请求"""
+    name = None            # 结果里的 template-id，默认取模块文件名
+    severity = "unknown"
+    test = False           # 自检用的测试插件，默认不跑，只有 --pocs 点名时才加载
+    session = None
+
     @abstractmethod
     def verify(self, url: str) -> bool:
         """返回 True 表示漏洞存在"""
-        ...
\ No newline at end of file
+        ...
+
+class AsyncPOCBase(ABC):
+    """异步 PoC：verify 是协程，client 为 runner 传入的共享 aiohttp.ClientSession（连接池 + keep-alive + DNS 缓存，已带超时）
+    成千上万个检查在同一个事件循环里并发，不要在 verify 里做阻塞调用"""
+    name = None
+    severity = "unknown"
+    test = False
+
+    @abstractmethod
+    async def verify(self, url: str, client) -> bool | dict:
+        """返回 True 表示漏洞存在；也可以返回 {"matched": True, ...} 附带证据（请求、响应片段、提取值等）"""
+        ...
@@ -1,56 +1,143 @@
 #!/usr/bin/env python3
-import json, pathlib, sys
+"""
+poc-framework/main.py  -- nuclei 结果去重入库
+漏洞库是 intel.db 里的 vulns 表，(host, template_id) 唯一；每次只把新结果批量 upsert 进去，
+final_vulns.json 只在 --export 时导出（附带 predict.py 写入 risk_scores 的风险分）
+poc.json（runner.py 的插件结果）同样按 (host, template_id) 合并
+用法：python poc-framework/main.py [--export]
+"""
+import argparse, json, pathlib, sqlite3, time
 
 ROOT = pathlib.Path(__file__).parent.parent
 json_lines = ROOT / "clean" / "nuclei.json"
+poc_json   = ROOT / "clean" / "poc.json"          # runner.py 的插件验证结果
 final_json = ROOT / "clean" / "final_vulns.json"
+DB = ROOT / "intel.db"
+BATCH = 5000
 
-if final_json.exists():
+UPSERT_SQL = """
+    INSERT INTO vulns(host, ip, template_id, severity, risk_score, first_seen, last_seen)
+    VALUES (?,?,?,?,?,?,?)
+    ON CONFLICT(host, template_id) DO UPDATE SET
+        severity   = COALESCE(excluded.severity, vulns.severity),
+        risk_score = COALESCE(excluded.risk_score, vulns.risk_score),
+        last_seen  = excluded.last_seen
+"""
+
+
+def init_store(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vulns(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            host TEXT NOT NULL,
+            ip TEXT,
+            template_id TEXT NOT NULL,
+            severity TEXT,
+            risk_score REAL,                -- 旧 final_vulns.json 带过来的分数，risk_scores 没有时兜底
+            first_seen TEXT,
+            last_seen TEXT,
+            UNIQUE(host, template_id)
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vulns_ip ON vulns(ip)")
+
+
+def iter_findings(fp):
+    """逐行读取 nuclei 输出，兼容单行数组与 JSONL 两种格式"""
+    with open(fp, encoding="utf-8-sig") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                raw = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"⚠️ 第 {lineno} 行解析失败：{e}")
+                continue
+            for item in raw if isinstance(raw, list) else [raw]:
+                yield {
+                    "template-id": item.get("template-id"),
+                    "host": item.get("host"),
+                    "severity": (item.get("info") or {}).get("severity") or item.get("severity"),
+                }
+
+
+def merge(conn, findings):
+    """分批 upsert，返回 (处理条数, 新增条数)；id 自增，新增条数按主键范围数 id > 合并前最大 id，不扫全表"""
+    before = conn.execute("SELECT COALESCE(MAX(id), 0) FROM vulns").fetchone()[0]
+    now = time.strftime("%F %T")
+    batch, total = [], 0
+    for v in findings:
+        host, tid = v.get("host"), v.get("template-id")
+        if not host or not tid:
+            continue
+        batch.append((host, host.partition(":")[0], tid, v.get("severity"), v.get("risk_score"), now, now))
+        if len(batch) >= BATCH:
+            conn.executemany(UPSERT_SQL, batch)
+            total += len(batch); batch.clear()
+    if batch:
+        conn.executemany(UPSERT_SQL, batch)
+        total += len(batch)
+    conn.commit()
+    return total, conn.execute("SELECT COUNT(*) FROM vulns WHERE id > ?", (before,)).fetchone()[0]
+
+
+def import_legacy(conn):
+    """首次运行：把旧的 final_vulns.json 导入 vulns 表"""
+    if conn.execute("SELECT 1 FROM vulns LIMIT 1").fetchone() or not final_json.exists():
+        return
     try:
         old_vulns = json.loads(final_json.read_text(encoding="utf-8"))
     except json.JSONDecodeError:
-        old_vulns = []
-else:
-    old_vulns = []
-
-if not json_lines.exists():
-    print("❌ 找不到 nuclei.json")
-    sys.exit(0)
-
-new_vulns = []
-with open(json_lines, encoding="utf-8-sig") as f:
-    for lineno, line in enumerate(f, 1):
-        line = line.strip()
-        if not line:
-            continue
-        try:
-            raw = json.loads(line)
-
-            # 兼容 list / dict 两种格式
-            if isinstance(raw, list):
-                for item in raw:
-                    new_vulns.append({
-                        "template-id": item.get("template-id"),
-                        "host": item.get("host"),
-                        "severity": item.get("info", {}).get("severity")
-                    })
-            else:
-                new_vulns.append({
-                    "template-id": raw.get("template-id"),
-                    "host": raw.get("host"),
-                    "severity": raw.get("info", {}).get("severity")
-                })
-        except json.JSONDecodeError as e:
-            print(f"⚠️ 第 {lineno} 行解析失败：{e}")
-            continue
+        return
+    _, added = merge(conn, old_vulns if isinstance(old_vulns, list) else [])
+    print(f"✅ 已从 final_vulns.json 导入 {added} 条历史漏洞")
+
+
+def export(conn, fp=final_json):
+    """流式导出 final_vulns.json（格式与旧版一致），risk_score 取自 risk_scores 表"""
+    has_scores = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='risk_scores'").fetchone()
+    sql = ("SELECT v.template_id, v.host, v.severity, COALESCE(r.score, v.risk_score) FROM vulns v "
+           "LEFT JOIN risk_scores r ON r.ip = v.ip ORDER BY v.id") if has_scores else \
+          "SELECT template_id, host, severity, risk_score FROM vulns ORDER BY id"
+    tmp = fp.with_suffix(".tmp")
+    n = 0
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("[")
+        for tid, host, sev, score in conn.execute(sql):
+            rec = {"template-id": tid, "host": host, "severity": sev}
+            if score is not None:
+                rec["risk_score"] = score
+            body = json.dumps(rec, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+            f.write(("," if n else "") + "\n  " + body)
+            n += 1
+        f.write("\n]" if n else "]")
+    tmp.replace(fp)
+    return n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--export", action="store_true", help="合并后导出 clean/final_vulns.json")
+    args = ap.parse_args()
+
+    conn = sqlite3.connect(DB)
+    init_store(conn)
+    import_legacy(conn)
+
+    if not json_lines.exists():
+        print("❌ 找不到 nuclei.json")
+    for fp in (json_lines, poc_json):
+        if fp.exists():
+            total, added = merge(conn, iter_findings(fp))
+            print(f"✅ 已合并 {fp.name}：{total} 条结果，新增 {added} 条漏洞")
 
-# 去重（host + template-id）
-seen = {(v["host"], v["template-id"]) for v in old_vulns if v.get("host") and v.get("template-id")}
-merged = old_vulns + [v for v in new_vulns
-                      if (v.get("host"), v.get("template-id")) not in seen
-                      and v.get("host") and v.get("template-id")]
+    if args.export:
+        n = export(conn)
+        print(f"✅ 已写入 final_vulns.json，共 {n} 条漏洞")
+    conn.close()
 
-with open(final_json, "w", encoding="utf-8") as f:
-    json.dump(merged, f, indent=2, ensure_ascii=False)
 
-print(f"✅ 已写入 final_vulns.json，共 {len(merged)} 条漏洞（新增 {len(merged) - len(old_vulns)} 条）")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
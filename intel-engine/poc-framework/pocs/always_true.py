@@ -1,6 +1,7 @@
 import random
 from lib.core import POCBase
 class POC(POCBase):
+    test = True    # 结果是随机的，只用来验证框架流程：python poc-framework/runner.py --pocs always_true
     def verify(self, url):
         # 强制随机命中，确保框架流程正确
         return random.choice([True, False])
\ No newline at end of file
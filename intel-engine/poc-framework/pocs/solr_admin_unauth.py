@@ -0,0 +1,18 @@
+from lib.core import AsyncPOCBase
+
+class POC(AsyncPOCBase):
+    """Solr 管理接口未授权访问：能直接列出 core 即命中"""
+    severity = "high"
+
+    async def verify(self, url, client):
+        target = url.rstrip("/") + "/solr/admin/cores?action=STATUS&wt=json"
+        async with client.get(target, allow_redirects=False) as r:
+            if r.status != 200:
+                return False
+            body = await r.text(errors="replace")
+            try:
+                data = await r.json(content_type=None)
+            except ValueError:
+                return False
+        cores = list((data.get("status") or {}).keys()) if isinstance(data, dict) else []
+        return {"matched": "responseHeader" in body, "request": target, "extracted-results": cores}
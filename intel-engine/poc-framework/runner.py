@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+poc-framework/runner.py  -- 并发跑 pocs/ 下的全部 PoC 插件
+发现 pocs/*.py 里的 POC 类，对 alive.txt 中每个目标执行 verify；同步插件（POCBase）走线程池 + 共享
+requests.Session，异步插件（AsyncPOCBase）在一个事件循环里跑，共享一个 aiohttp.ClientSession。
+全局并发与单主机并发分别限流，结果按 nuclei 的 (host, template-id) 形状写成 JSONL，由 main.py 合并入库
+用法：python poc-framework/runner.py [--targets urls.txt] [--pocs a,b]
+"""
+import argparse, asyncio, importlib.util, inspect, json, pathlib, sys, threading, time, yaml
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+
+BASE = pathlib.Path(__file__).parent
+ROOT = BASE.parent
+sys.path.insert(0, str(BASE))
+from lib.core import POCBase, AsyncPOCBase
+
+cfg = yaml.safe_load(open(ROOT / "config.yaml", encoding="utf-8"))
+pcfg = cfg.get("poc", {})
+
+
+class TimeoutAdapter(HTTPAdapter):
+    """插件没传 timeout 时补上默认值，保证单次请求不会无限挂起"""
+    def __init__(self, timeout, **kw):
+        self.timeout = timeout
+        super().__init__(**kw)
+
+    def send(self, request, **kw):
+        if kw.get("timeout") is None:
+            kw["timeout"] = self.timeout
+        return super().send(request, **kw)
+
+
+def make_session(workers, timeout):
+    s = requests.Session()
+    adapter = TimeoutAdapter(timeout, pool_connections=workers, pool_maxsize=workers)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.verify = False
+    return s
+
+
+def make_client(workers, per_host, timeout):
+    """异步插件共用的 aiohttp.ClientSession：连接按主机复用（keep-alive），DNS 结果缓存 5 分钟。
+    不用 httpx.AsyncClient：它的连接池每次分配都要遍历全部连接，上千在途连接时 CPU 全耗在池管理上"""
+    import aiohttp
+    connector = aiohttp.TCPConnector(limit=workers, limit_per_host=per_host, ttl_dns_cache=300,
+                                     keepalive_timeout=30, ssl=False)
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout))
+
+
+def load_pocs(only=None):
+    """pocs/*.py → [(template-id, POC 实例)]；test = True 的自检插件只在 only 点名时加载，结果不会混进漏洞库"""
+    pocs = []
+    for fp in sorted((BASE / "pocs").glob("*.py")):
+        if fp.stem.startswith("_") or (only and fp.stem not in only):
+            continue
+        spec = importlib.util.spec_from_file_location(f"pocs.{fp.stem}", fp)
+        mod = importlib.util.module_from_spec(spec)
+        try:
+            spec.loader.exec_module(mod)
+        except Exception as e:
+            print(f"⚠️ 加载 {fp.name} 失败：{e}")
+            continue
+        cls = getattr(mod, "POC", None)
+        if not (inspect.isclass(cls) and issubclass(cls, (POCBase, AsyncPOCBase))):
+            continue
+        if cls.test and not (only and fp.stem in only):
+            continue
+        pocs.append((cls.name or fp.stem, cls()))
+    return pocs
+
+
+def load_targets(fp):
+    return [l.strip() for l in open(fp, encoding="utf-8") if l.strip()]
+
+
+def host_of(url):
+    return urlparse(url if "://" in url else f"http://{url}").netloc
+
+
+def outcome(ret):
+    """verify 可以返回 bool，也可以返回 {"matched": bool, 其余字段作为证据}"""
+    if isinstance(ret, dict):
+        evidence = {k: v for k, v in ret.items() if k != "matched"}
+        return ("hit" if ret.get("matched") else "miss"), evidence or None
+    return ("hit" if ret else "miss"), None
+
+
+def finding(tid, poc, url, evidence=None):
+    rec = {
+        "template-id": tid,
+        "host": host_of(url),
+        "matched-at": url,
+        "type": "poc",
+        "info": {"name": tid, "severity": poc.severity},
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if evidence:
+        rec["evidence"] = evidence
+    return rec
+
+
+def record(f, stats, tid, poc, url, status, evidence=None):
+    stats[status] += 1
+    if status == "hit":
+        f.write(json.dumps(finding(tid, poc, url, evidence), ensure_ascii=False, default=str) + "\n")
+
+
+# ---------- 同步插件：线程池 ----------
+def run_threads(pocs, targets, f, stats, workers=64, per_host=2, timeout=10):
+    """按「插件 × 目标」派发；同一主机的任务在队列里被其它主机隔开，再用信号量兜底限流"""
+    session = make_session(workers, timeout)
+    for _, poc in pocs:
+        poc.session = session
+    host_sem, lock = {}, threading.Lock()
+
+    def call(tid, poc, url):
+        with lock:
+            sem = host_sem.setdefault(host_of(url), threading.BoundedSemaphore(per_host))
+        with sem:
+            t0 = time.monotonic()
+            try:
+                status, evidence = outcome(poc.verify(url))
+            except requests.Timeout:
+                return tid, poc, url, "timeout", None
+            except Exception:
+                return tid, poc, url, "error", None
+            # 线程无法强杀，verify 内部多次请求累计超时的结果直接丢弃
+            if time.monotonic() - t0 > timeout * 2:
+                return tid, poc, url, "timeout", None
+            return tid, poc, url, status, evidence
+
+    jobs = ((tid, poc, url) for tid, poc in pocs for url in targets)
+    with ThreadPoolExecutor(workers) as pool:
+        pending = set()
+        for job in jobs:
+            pending.add(pool.submit(call, *job))
+            if len(pending) >= workers * 4:          # 滑动窗口，目标再多也不会一次性堆满内存
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    record(f, stats, *fut.result())
+        for fut in pending:
+            record(f, stats, *fut.result())
+    session.close()
+
+
+# ---------- 异步插件：单事件循环 ----------
+async def run_async(pocs, targets, f, stats, workers=1000, per_host=2, timeout=10):
+    """workers 个协程从同一个任务迭代器取活，在途检查数恒定；超时用 wait_for 直接取消"""
+    host_sem = {}
+    jobs = ((tid, poc, url) for tid, poc in pocs for url in targets)
+
+    async def worker(client):
+        for tid, poc, url in jobs:
+            sem = host_sem.setdefault(host_of(url), asyncio.Semaphore(per_host))
+            async with sem:
+                try:
+                    status, evidence = outcome(await asyncio.wait_for(poc.verify(url, client), timeout * 2))
+                except asyncio.TimeoutError:
+                    status, evidence = "timeout", None
+                except Exception:
+                    status, evidence = "error", None
+            record(f, stats, tid, poc, url, status, evidence)
+
+    async with make_client(workers, per_host, timeout) as client:
+        await asyncio.gather(*(worker(client) for _ in range(min(workers, len(pocs) * len(targets)))))
+
+
+def run(pocs, targets, out, workers=64, async_workers=1000, per_host=2, timeout=10):
+    stats = {"hit": 0, "miss": 0, "error": 0, "timeout": 0}
+    sync_pocs = [(t, p) for t, p in pocs if isinstance(p, POCBase)]
+    async_pocs = [(t, p) for t, p in pocs if isinstance(p, AsyncPOCBase)]
+    with open(out, "w", encoding="utf-8") as f:
+        if async_pocs:
+            asyncio.run(run_async(async_pocs, targets, f, stats, async_workers, per_host, timeout))
+        if sync_pocs:
+            run_threads(sync_pocs, targets, f, stats, workers, per_host, timeout)
+    return stats
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--targets", default=str(ROOT / cfg["paths"]["alive_txt"]), help="目标 URL 列表，默认 alive.txt")
+    ap.add_argument("--pocs", help="只跑指定插件，逗号分隔（文件名）")
+    ap.add_argument("--output", default=str(ROOT / pcfg.get("output", "clean/poc.json")))
+    args = ap.parse_args()
+
+    pocs = load_pocs(set(args.pocs.split(",")) if args.pocs else None)
+    targets = load_targets(args.targets) if pathlib.Path(args.targets).exists() else []
+    if not pocs or not targets:
+        print(f"❌ 插件 {len(pocs)} 个，目标 {len(targets)} 个，跳过")
+        return
+    requests.packages.urllib3.disable_warnings()
+    t0 = time.time()
+    stats = run(pocs, targets, args.output, pcfg.get("workers", 64), pcfg.get("async_workers", 1000),
+                pcfg.get("per_host", 2), pcfg.get("timeout", 10))
+    print(f"✅ {len(pocs)} 个插件 × {len(targets)} 个目标，用时 {time.time() - t0:.1f}s，"
+          f"命中 {stats['hit']} / 未命中 {stats['miss']} / 异常 {stats['error']} / 超时 {stats['timeout']} → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
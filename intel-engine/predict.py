@@ -1,21 +1,22 @@
 #!/usr/bin/env python3
 """
-predict.py  -- 单文件推理
+predict.py  -- 单文件推理 / 常驻打分服务
 用法：python predict.py D:\pythonProject1\intel-engine\clean\final_vulns.json
+      python predict.py --serve [--port 8765] [clean/final_vulns.json]
+      python predict.py --incremental clean/final_vulns.json   # 只重算变化节点的 k 跳邻域
+      python predict.py --fast [--int8] [--threads 8] clean/final_vulns.json   # TorchScript 快路径
 """
-import json, pathlib as pl, sys, tempfile
+import argparse, hashlib, json, pathlib as pl, sqlite3, threading, time
+import numpy as np
 import torch
-import networkx as nx
-from torch_geometric.utils import from_networkx
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from graph_features import build, load_adj, load_graph, load_vocab, pack_ipv4, subnet_edges
 
-# 与 train.py 完全一致的特征与网络定义
-def load_json(fp):
-    raw = json.load(open(fp, encoding="utf-8"))
-    return json.loads(raw) if isinstance(raw, str) else (raw if isinstance(raw, list) else [raw])
-
-def ip_subnet(ip):   # 训练时同 /24 连边
-    return '.'.join(ip.split('.')[:3])
+ROOT = pl.Path(__file__).parent / "clean"
+DB   = ROOT.parent / "intel.db"
+LAYERS = 3          # GCN 层数：节点变化只影响 3 跳内节点的输出
 
+# 与 train.py 完全一致的网络定义；建图与特征见 graph_features.py
 class GNN(torch.nn.Module):
     def __init__(self, in_dim=4, hid=64, out=2):
         super().__init__()
@@ -31,70 +32,223 @@ class GNN(torch.nn.Module):
         x = torch.dropout(x, p=0.5, train=self.training)
         return self.conv3(x, edge_index)
 
-# ---------- 与训练完全一致的建图 ----------
-def build_graph_from_records(records):
-    import numpy as np
-    import networkx as nx
-
-    # 统计字典
-    ip_info, templates = {}, set()
-    for r in records:
-        host   = (r.get("host") or r.get("matched-at") or "0.0.0.0:0") if isinstance(r, dict) else str(r)
-        ip     = host.split(":")[0]
-        port   = int(host.split(":")[1]) if ":" in host else 8983
-        sev    = r.get("severity","unknown").lower() if isinstance(r, dict) else "unknown"
-        cvss   = r.get("info",{}).get("classification",{}).get("cvss-score", 0.218) if isinstance(r, dict) else 0.218
-        tmpl   = r.get("template-id","unknown") if isinstance(r, dict) else "unknown"
-        templates.add(tmpl)
-        ip_info[ip] = {"sev": sev, "cvss": cvss, "port": port, "tmpl": tmpl}
-
-    # 编码
-    sev2id  = {s:i for i,s in enumerate(["critical","high","medium","low","info","unknown"])}
-    tmpl2id = {t:i for i,t in enumerate(sorted(templates))}
-
-    G = nx.Graph()
-    for ip, info in ip_info.items():
-        sev_id   = sev2id[info["sev"]]
-        tmpl_id  = tmpl2id[info["tmpl"]]
-        feat = [float(info["cvss"]),
-                info["port"]/65535.0,
-                float(sev_id),
-                float(tmpl_id)]
-        label = 1 if info["sev"] in {"critical","high"} else 0
-        G.add_node(ip, x=feat, y=label)
-
-    # 同 /24 连边
-    subnets = {}
-    for ip in G.nodes:
-        subnets.setdefault(ip_subnet(ip), []).append(ip)
-    for ip_list in subnets.values():
-        if len(ip_list) >= 2:
-            for i in range(len(ip_list)):
-                for j in range(i+1, len(ip_list)):
-                    G.add_edge(ip_list[i], ip_list[j])
-
-    data = from_networkx(G)
-    data.x = torch.tensor(list(nx.get_node_attributes(G, "x").values()), dtype=torch.float)
-    data.y = torch.tensor(list(nx.get_node_attributes(G, "y").values()), dtype=torch.long)
-    return data, list(G.nodes)
-
 # ---------- 推理 ----------
-def predict(json_file):
-    records = load_json(json_file)
-    data, nodes = build_graph_from_records(records)
-    data = data.to("cpu")
-
+def load_model():
     model = GNN().to("cpu")
     model.load_state_dict(torch.load(ROOT / "risk_gnn_final.pt", map_location="cpu"))
     model.eval()
+    return model
+
+def predict(json_file):
+    vocab = load_vocab()
+    if vocab is None:
+        print("⚠️ 未找到训练词表 risk_gnn_vocab.json，按输入临时建词表，请重新运行 train.py")
+    g = load_graph(json_file, vocab)
+    nodes = g["nodes"]
+
+    model = load_model()
 
     with torch.no_grad():
-        logits = model(data.x, data.edge_index)
+        logits = model(g["x"], g["edge_index"])
         probs  = torch.softmax(logits, dim=1)[:, 1]
 
     for ip, p in zip(nodes, probs.tolist()):
         print(f"{ip:<15}  风险概率: {p:.4f}")
 
+def predict_fast(json_file, int8=False, threads=None):
+    """只加载 export_gnn 导出的 TorchScript + 预归一化邻接，不 import torch_geometric"""
+    import export_gnn
+    model = export_gnn.load(int8, threads)
+    g = load_adj(json_file, load_vocab())
+    with torch.inference_mode():
+        probs = torch.softmax(model(g["x"], g["adj"]), dim=1)[:, 1]
+
+    for ip, p in zip(g["nodes"], probs.tolist()):
+        print(f"{ip:<15}  风险概率: {p:.4f}")
+
+# ---------- 增量打分 ----------
+def model_version(model_file=ROOT / "risk_gnn_final.pt", meta_file=ROOT / "risk_gnn_meta.json"):
+    """train.py 写入的模型版本（权重哈希，只在重训时变化）；旧模型没有 meta 时直接算模型文件哈希"""
+    try:
+        return json.loads(meta_file.read_text(encoding="utf-8"))["version"]
+    except (OSError, ValueError, KeyError):
+        return hashlib.blake2b(model_file.read_bytes(), digest_size=8).hexdigest()
+
+def node_fingerprints(x, version=None):
+    """特征行 + 模型版本的指纹，和 risk_scores 里上次打分时的指纹比对即可知道节点是否要重算；
+    只有 train.py 真正重训出新权重时所有节点才会重算"""
+    salt = bytes.fromhex(version or model_version())[:16]
+    return [hashlib.blake2b(row.tobytes(), digest_size=8, salt=salt).hexdigest() for row in x.numpy()]
+
+def init_score_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS risk_scores(
+            ip TEXT PRIMARY KEY,
+            fingerprint TEXT,
+            score REAL,
+            scored_at TEXT
+        )""")
+
+def changed_nodes(nodes, fps, old, prefix=24):
+    """新增 / 特征变化的节点，外加被删节点的同子网节点（它们的度数变了）"""
+    index = {ip: i for i, ip in enumerate(nodes)}
+    changed = {i for i, ip in enumerate(nodes) if old.get(ip) != fps[i]}
+    removed = [ip for ip in old if ip not in index]
+    gone = pack_ipv4(removed)
+    if (gone >= 0).any():
+        packed = pack_ipv4(nodes)
+        hit = (packed >= 0) & np.isin(packed >> (32 - prefix), gone[gone >= 0] >> (32 - prefix))
+        changed.update(np.flatnonzero(hit).tolist())
+    return sorted(changed), removed
+
+def score_incremental(json_file, db=DB):
+    """只对自上次打分以来变化节点的 3 跳邻域重新打分，结果只写 intel.db 的 risk_scores；
+    final_vulns.json 不重写，poc-framework/main.py --export 与看板按 ip 关联 risk_scores 取分"""
+    from torch_geometric.utils import k_hop_subgraph
+    vocab = load_vocab()
+    if vocab is None:
+        raise SystemExit("❌ 未找到训练词表 risk_gnn_vocab.json，请先运行 train.py")
+    g = load_graph(json_file, vocab)
+    nodes, x, edge_index = g["nodes"], g["x"], g["edge_index"]
+    fps = node_fingerprints(x)
+
+    conn = sqlite3.connect(db)
+    init_score_table(conn)
+    old = dict(conn.execute("SELECT ip, fingerprint FROM risk_scores"))
+    changed, removed = changed_nodes(nodes, fps, old)
+    conn.executemany("DELETE FROM risk_scores WHERE ip=?", [(ip,) for ip in removed])
+    if not changed:
+        conn.commit(); conn.close()
+        print(f"✅ 无变化节点，跳过打分（共 {len(nodes)} 个节点）")
+        return {}
+
+    n = len(nodes)
+    affected, *_ = k_hop_subgraph(torch.tensor(changed), LAYERS, edge_index, num_nodes=n)
+    # 受影响节点的输出依赖 3 跳内的特征和这些节点的度数，所以诱导子图再多取一跳
+    subset, sub_edges, mapping, _ = k_hop_subgraph(affected, LAYERS + 1, edge_index,
+                                                   relabel_nodes=True, num_nodes=n)
+    with torch.no_grad():
+        probs = torch.softmax(load_model()(x[subset], sub_edges), dim=1)[mapping, 1]
+
+    now = time.strftime("%F %T")
+    scores = {nodes[i]: round(p, 4) for i, p in zip(affected.tolist(), probs.tolist())}
+    conn.executemany("""
+        INSERT INTO risk_scores(ip, fingerprint, score, scored_at) VALUES (?,?,?,?)
+        ON CONFLICT(ip) DO UPDATE SET fingerprint=excluded.fingerprint,
+            score=excluded.score, scored_at=excluded.scored_at""",
+        [(nodes[i], fps[i], scores[nodes[i]], now) for i in affected.tolist()])
+    conn.commit(); conn.close()
+
+    print(f"✅ 变化 {len(changed)} 个节点 → 重算 {len(scores)} 个（子图 {len(subset)}/{n}）")
+    return scores
+
+# ---------- 常驻打分 ----------
+class RiskScorer:
+    """模型与当前图常驻内存；新发现增量加点（同子网自动连边）后只对受影响的子网做前向。
+    同 /24 子网是全连接，节点的 3 跳邻域就是整个子网，所以局部前向与全图结果一致"""
+
+    def __init__(self, json_file=None, model_path=None, prefix=24):
+        self.vocab = load_vocab()
+        if self.vocab is None:
+            raise RuntimeError("未找到训练词表 risk_gnn_vocab.json，请先运行 train.py")
+        self.prefix = prefix
+        self.model = GNN().to("cpu")
+        self.model.load_state_dict(torch.load(model_path or ROOT / "risk_gnn_final.pt", map_location="cpu"))
+        self.model.eval()
+
+        self.nodes, self.index, self.keys, self.packed = [], {}, [], []
+        self.members = {}                      # 子网 → 节点下标
+        self.x = torch.empty((0, 4))
+        self.lock = threading.Lock()
+        if json_file:
+            g = load_graph(json_file, self.vocab)
+            self._append(g["nodes"], g["x"])
+
+    def _append(self, ips, x):
+        packed = pack_ipv4(ips)
+        for ip, p in zip(ips, packed.tolist()):
+            j = len(self.nodes)
+            key = p >> (32 - self.prefix) if p >= 0 else None
+            self.nodes.append(ip); self.index[ip] = j
+            self.keys.append(key); self.packed.append(p)
+            if key is not None:
+                self.members.setdefault(key, []).append(j)
+        self.x = torch.cat([self.x, x])
+
+    def add(self, records):
+        """合入一批 nuclei 发现：新 IP 加节点，已有 IP 覆盖特征；返回本批节点下标"""
+        g = build(records, self.vocab, self.prefix)
+        new = [i for i, ip in enumerate(g["nodes"]) if ip not in self.index]
+        for i, ip in enumerate(g["nodes"]):
+            if ip in self.index:
+                self.x[self.index[ip]] = g["x"][i]
+        if new:
+            self._append([g["nodes"][i] for i in new], g["x"][new])
+        return [self.index[ip] for ip in g["nodes"]]
+
+    def score_nodes(self, idxs):
+        sub = sorted({m for j in idxs for m in (self.members.get(self.keys[j]) or [j])})
+        local = {j: i for i, j in enumerate(sub)}
+        edges = subnet_edges(np.asarray([self.packed[j] for j in sub], dtype=np.int64), self.prefix, undirected=True)
+        with torch.no_grad():
+            probs = torch.softmax(self.model(self.x[sub], torch.from_numpy(edges)), dim=1)[:, 1]
+        return {self.nodes[j]: round(probs[local[j]].item(), 4) for j in idxs}
+
+    def score(self, records):
+        with self.lock:
+            return self.score_nodes(self.add(records))
+
+def serve(scorer, host="127.0.0.1", port=8765):
+    """POST /score  body 为 nuclei 发现列表（或单条），返回 {ip: 风险概率}；GET /health"""
+    class Handler(BaseHTTPRequestHandler):
+        def reply(self, code, obj):
+            body = json.dumps(obj, ensure_ascii=False).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self.reply(200, {"nodes": len(scorer.nodes)})
+            else:
+                self.reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                return self.reply(404, {"error": "not found"})
+            try:
+                records = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            except json.JSONDecodeError as e:
+                return self.reply(400, {"error": str(e)})
+            self.reply(200, scorer.score(records if isinstance(records, list) else [records]))
+
+        def log_message(self, fmt, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    print(f"✅ 打分服务已启动 http://{host}:{port}  当前节点数 {len(scorer.nodes)}")
+    httpd.serve_forever()
+
 if __name__ == "__main__":
-    ROOT = pl.Path(__file__).parent / "clean"
-    predict(sys.argv[1])
\ No newline at end of file
+    ap = argparse.ArgumentParser()
+    ap.add_argument("json_file", nargs="?")
+    ap.add_argument("--serve", action="store_true", help="常驻服务模式")
+    ap.add_argument("--fast", action="store_true", help="TorchScript 快路径（需先 python export_gnn.py）")
+    ap.add_argument("--int8", action="store_true", help="快路径使用 int8 动态量化模型")
+    ap.add_argument("--threads", type=int, help="推理线程数，默认由 torch 决定")
+    ap.add_argument("--incremental", action="store_true", help="只重算变化节点的 3 跳邻域，写入 risk_scores")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args()
+    if args.serve:
+        serve(RiskScorer(args.json_file), args.host, args.port)
+    elif args.fast and args.json_file:
+        predict_fast(args.json_file, args.int8, args.threads)
+    elif args.incremental and args.json_file:
+        score_incremental(args.json_file)
+    elif args.json_file:
+        predict(args.json_file)
+    else:
+        ap.error("需要 json_file 或 --serve")
@@ -3,12 +3,16 @@
 """
 recon.py – 完全适配你的 config.yaml
 """
-import os, sys, json, base64, yaml, sqlite3, logging, time, requests, subprocess
+import os, sys, json, base64, hashlib, math, yaml, sqlite3, logging, time, requests, subprocess, threading
 from pathlib import Path
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from datetime import datetime, date, timedelta
 from tqdm import tqdm
 import argparse
 from dotenv import load_dotenv
+import template_index
 
 ROOT = Path(__file__).parent
 load_dotenv(ROOT / ".env")          # 允许 .env 覆盖
@@ -44,19 +48,92 @@ def init_db():
             banner TEXT,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )""")
+        migrate_unique(conn)
+        # 分页拉取游标：每条查询记录下一页，中断后续拉
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS fofa_cursor(
+            query      TEXT PRIMARY KEY,
+            next_page  INTEGER,
+            total      INTEGER,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )""")
+        # 游标存续期间已拉到的 URL：续拉时一并返回，中断前入库的资产也会被扫描
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS fofa_cursor_urls(
+            query TEXT,
+            url   TEXT,
+            PRIMARY KEY(query, url)
+        )""")
+        # 扫描缓存：每个 URL 在某个模板版本下最后一次的 httpx 指纹与 nuclei 结论
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS scan_state(
+            host        TEXT,
+            tpl_version TEXT,
+            fingerprint TEXT,
+            verdict     TEXT,
+            scanned_at  DATETIME,
+            PRIMARY KEY(host, tpl_version)
+        )""")
+        # 增量同步：每条查询最后一次完整同步到的日期，下次只拉这之后更新的资产
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS fofa_sync(
+            query        TEXT PRIMARY KEY,
+            synced_until DATE,
+            updated_at   DATETIME DEFAULT CURRENT_TIMESTAMP
+        )""")
+
+def migrate_unique(conn):
+    """旧库的 assets 没有 (ip, port) 唯一约束：先去重（保留最新一条），再补唯一索引，之后写入都按 (ip, port) 合并"""
+    t, ip, port = cfg["sqlite"]["table"], cfg["sqlite"]["col_ip"], cfg["sqlite"]["col_port"]
+    for _, name, unique, *_ in conn.execute(f"PRAGMA index_list({t})").fetchall():
+        if unique and [r[2] for r in conn.execute(f"PRAGMA index_info({name})")] == [ip, port]:
+            return
+    n = conn.execute(f"""
+    DELETE FROM {t} WHERE rowid NOT IN (SELECT MAX(rowid) FROM {t} GROUP BY {ip}, {port})
+    """).rowcount
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{t}_{ip}_{port} ON {t}({ip}, {port})")
+    log.info(f"assets 去重 {n} 条，已建 ({ip}, {port}) 唯一索引")
 init_db()
 
 # ---------- FOFA ----------
-def fofa_fetch():
-    api = "https://fofa.info/api/v1/search/all"
-    params = {
+FOFA_API = "https://fofa.info/api/v1/search/all"
+
+def fofa_params(query, size, page=1):
+    return {
         "email": cfg["fofa"]["email"],
         "key":   cfg["fofa"]["key"],
-        "qbase64": base64.b64encode(cfg["fofa"]["query"].encode()).decode(),
+        "qbase64": base64.b64encode(query.encode()).decode(),
         "fields": cfg["fofa"]["fields"],
-        "size": cfg["fofa"]["size"]
+        "size": size,
+        "page": page
     }
-    r = requests.get(api, params=params, timeout=30)
+
+def save_rows(conn, rows):
+    """按 (ip, port) upsert：已有资产刷新字段与时间戳，新值为空时保留旧值"""
+    t = cfg["sqlite"]["table"]
+    conn.executemany(f"""
+    INSERT INTO {t}
+    ({cfg["sqlite"]["col_ip"]}, {cfg["sqlite"]["col_port"]}, protocol, host, title, banner)
+    VALUES (?,?,?,?,?,?)
+    ON CONFLICT({cfg["sqlite"]["col_ip"]}, {cfg["sqlite"]["col_port"]}) DO UPDATE SET
+        protocol  = COALESCE(excluded.protocol, {t}.protocol),
+        host      = COALESCE(excluded.host,     {t}.host),
+        title     = COALESCE(excluded.title,    {t}.title),
+        banner    = COALESCE(excluded.banner,   {t}.banner),
+        timestamp = CURRENT_TIMESTAMP
+    """, rows)
+
+def row_to_url(flds, row):
+    d = dict(zip(flds, row))
+    host_or_ip = d.get("host") or f"{d['ip']}:{d['port']}"
+    if "://" in host_or_ip:
+        return host_or_ip
+    scheme = d.get("protocol", "http")
+    return f"{scheme}://{host_or_ip}".rstrip("/")
+
+def fofa_fetch():
+    params = fofa_params(cfg["fofa"]["query"], cfg["fofa"]["size"])
+    r = requests.get(FOFA_API, params=params, timeout=30)
     r.raise_for_status()
     data = r.json()
     if data.get("error"):
@@ -71,36 +148,186 @@ def fofa_fetch():
 
     # 写入 SQLite
     with sqlite3.connect(DB) as conn:
-        conn.executemany(f"""
-        INSERT INTO {cfg["sqlite"]["table"]}
-        ({cfg["sqlite"]["col_ip"]}, {cfg["sqlite"]["col_port"]}, protocol, host, title, banner)
-        VALUES (?,?,?,?,?,?)
-        """, rows)
+        save_rows(conn, rows)
 
     # 拼装 URL（已修复）
-    urls = []
-    for row in rows:
-        d = dict(zip(flds, row))
-        host_or_ip = d.get("host") or f"{d['ip']}:{d['port']}"
-        if "://" in host_or_ip:
-            url = host_or_ip
-        else:
-            scheme = d.get("protocol", "http")
-            url = f"{scheme}://{host_or_ip}".rstrip("/")
-        urls.append(url)
-    urls = list(dict.fromkeys(urls))
+    urls = list(dict.fromkeys(row_to_url(flds, row) for row in rows))
     log.info(f"FOFA 拉取 & 入库完成，共 {len(urls)} 个 URL")
     return urls
+
+# ---------- FOFA 分页 ----------
+def fofa_fetch_paged(query=None):
+    """多页并发拉取，每页落库后推进 fofa_cursor，中断后下次从断点续拉；
+    续拉时返回的 URL 包含之前中断那次已入库的页，整条查询拉完才清掉游标"""
+    query     = query or cfg["fofa"]["query"]
+    page_size = int(cfg["fofa"].get("page_size", 1000))
+    max_pages = int(cfg["fofa"].get("max_pages", 0))
+    cap       = int(cfg["fofa"].get("result_cap", 10000))
+    workers   = int(cfg["fofa"].get("workers", 4))
+    flds      = cfg["fofa"]["fields"].split(",")
+
+    # 连接池与并发页数一致，所有页复用同一批 TCP/TLS 连接
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=workers, max_retries=3))
+
+    def fetch(page):
+        r = session.get(FOFA_API, params=fofa_params(query, page_size, page), timeout=30)
+        r.raise_for_status()
+        data = r.json()
+        if data.get("error"):
+            raise RuntimeError(data.get("errmsg"))
+        return data
+
+    conn = sqlite3.connect(DB)
+    cur = conn.execute("SELECT next_page, total FROM fofa_cursor WHERE query=?", (query,)).fetchone()
+    page, total = cur if cur else (1, None)
+    urls = dict.fromkeys(u for (u,) in conn.execute("SELECT url FROM fofa_cursor_urls WHERE query=?", (query,)))
+    if cur:
+        log.info(f"FOFA 续拉：从第 {page} 页开始（共 {total} 条，之前已拉到 {len(urls)} 个 URL）")
+    stop = page + max_pages if max_pages else None
+
+    finished = False
+    try:
+        with ThreadPoolExecutor(workers) as pool:
+            while not finished:
+                # 总数未知时先单拉一页拿 size，之后每轮并发 workers 页；
+                # 超过 result_cap 的页 FOFA 直接报错，游标会卡在那一页，所以只翻到上限为止
+                last = math.ceil(min(total, cap) / page_size) if total is not None else page
+                end  = min(page + workers, last + 1, stop or sys.maxsize)
+                batch = list(range(page, end))
+                if not batch:
+                    finished = page > last
+                    break
+                # map 按页序返回，游标只会顺序前进
+                for p, data in zip(batch, pool.map(fetch, batch)):
+                    total = data.get("size", total or 0)
+                    rows  = data.get("results", [])
+                    page_urls = list(dict.fromkeys(row_to_url(flds, row) for row in rows))
+                    if rows:
+                        save_rows(conn, rows)
+                        conn.executemany("INSERT OR IGNORE INTO fofa_cursor_urls(query, url) VALUES (?,?)",
+                                         [(query, u) for u in page_urls])
+                    conn.execute("""
+                    INSERT INTO fofa_cursor(query, next_page, total, updated_at)
+                    VALUES (?,?,?,CURRENT_TIMESTAMP)
+                    ON CONFLICT(query) DO UPDATE SET
+                        next_page=excluded.next_page, total=excluded.total, updated_at=excluded.updated_at
+                    """, (query, p + 1, total))
+                    conn.commit()
+                    urls.update(dict.fromkeys(page_urls))
+                    page = p + 1
+                    log.debug(f"FOFA 第 {p} 页 {len(rows)} 条")
+                    if len(rows) < page_size:
+                        finished = True
+                        break
+    except (requests.RequestException, RuntimeError) as e:
+        # HTTPError 的文本里带完整 URL（含 key），只记状态码
+        reason = e.response.status_code if getattr(e, "response", None) is not None else e
+        log.error(f"FOFA 第 {page} 页失败，已保存游标，下次续拉: {reason}")
+    finally:
+        if finished:
+            conn.execute("DELETE FROM fofa_cursor WHERE query=?", (query,))
+            conn.execute("DELETE FROM fofa_cursor_urls WHERE query=?", (query,))
+            conn.commit()
+        conn.close()
+        session.close()
+
+    if total and total > cap:
+        log.warning(f"FOFA 查询共 {total} 条，超过单查询上限 {cap}，只拉了前 {cap} 条（全量请用 --delta 按时间窗拆分）")
+    urls = list(urls)
+    log.info(f"FOFA 分页拉取 & 入库完成，本次 {len(urls)} 个 URL（停在第 {page} 页，共 {total} 条）")
+    return urls
+# ---------- FOFA 增量同步 ----------
+def window_query(query, after, before):
+    return f'({query}) && after="{after.isoformat()}" && before="{before.isoformat()}"'
+
+def split_window(after, before):
+    """二分时间窗；FOFA 的 after / before 只到天，两半各多盖一天，边界那天不会漏（重复的按 (ip, port) 合并）"""
+    mid = after + (before - after) / 2
+    return [(after, mid + timedelta(days=1)), (mid, before)]
+
+def fofa_fetch_delta(query=None):
+    """只拉上次同步之后更新过的资产：查询加 after / before 时间窗，窗口结果数超过单查询上限（result_cap）
+    就二分成子窗口，直到每个窗口都能翻页拉完；各窗口、各页并发拉取。全部成功才推进 fofa_sync"""
+    query     = query or cfg["fofa"]["query"]
+    page_size = int(cfg["fofa"].get("page_size", 1000))
+    cap       = int(cfg["fofa"].get("result_cap", 10000))
+    workers   = int(cfg["fofa"].get("workers", 4))
+    flds      = cfg["fofa"]["fields"].split(",")
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=workers, max_retries=3))
+
+    def fetch(job):
+        q, page = job
+        r = session.get(FOFA_API, params=fofa_params(q, page_size, page), timeout=30)
+        r.raise_for_status()
+        data = r.json()
+        if data.get("error"):
+            raise RuntimeError(data.get("errmsg"))
+        return data
+
+    conn = sqlite3.connect(DB)
+    row = conn.execute("SELECT synced_until FROM fofa_sync WHERE query=?", (query,)).fetchone()
+    today = date.today()
+    # 回退一天：after 可能不含当天，上次同步当天稍晚更新的资产也能补上
+    since = row[0] if row else str(cfg["fofa"].get("sync_floor", "2015-01-01"))
+    start = date.fromisoformat(since) - timedelta(days=1)
+    log.info(f"FOFA 增量同步：{since} 之后更新的资产" + ("" if row else "（首次同步）"))
+
+    urls, windows, pages, ok = {}, [(start, today + timedelta(days=1))], [], False
+
+    def save(data):
+        rows = data.get("results", [])
+        if rows:
+            save_rows(conn, rows)
+            conn.commit()
+            urls.update(dict.fromkeys(row_to_url(flds, r) for r in rows))
+
+    try:
+        with ThreadPoolExecutor(workers) as pool:
+            # 每轮并发探测所有窗口的第 1 页：超限且还能切的窗口二分进下一轮，其余排出剩余页
+            while windows:
+                jobs = [(window_query(query, a, b), 1) for a, b in windows]
+                nxt = []
+                for (a, b), (q, _), data in zip(windows, jobs, pool.map(fetch, jobs)):
+                    total = int(data.get("size") or 0)
+                    if total > cap and (b - a).days > 2:
+                        nxt.extend(split_window(a, b))
+                        continue
+                    if total > cap:
+                        log.warning(f"FOFA {a}~{b} 共 {total} 条，超过单查询上限 {cap}，只能拉前 {cap} 条")
+                    save(data)
+                    pages.extend((q, p) for p in range(2, math.ceil(min(total, cap) / page_size) + 1))
+                windows = nxt
+            for data in pool.map(fetch, pages):
+                save(data)
+        ok = True
+    except (requests.RequestException, RuntimeError) as e:
+        reason = e.response.status_code if getattr(e, "response", None) is not None else e
+        log.error(f"FOFA 增量同步失败，同步点不前移，下次重拉本窗口: {reason}")
+    finally:
+        if ok:
+            conn.execute("""
+            INSERT INTO fofa_sync(query, synced_until, updated_at) VALUES (?,?,CURRENT_TIMESTAMP)
+            ON CONFLICT(query) DO UPDATE SET synced_until=excluded.synced_until, updated_at=excluded.updated_at
+            """, (query, today.isoformat()))
+            conn.commit()
+        conn.close()
+        session.close()
+
+    urls = list(urls)
+    log.info(f"FOFA 增量同步完成，本次 {len(urls)} 个 URL（{len(pages)} 个翻页请求）")
+    return urls
+
 # ---------- httpx ----------
+HTTPX_FLAGS = ["-sc", "-title", "-tech-detect", "-hash", "sha256", "-silent", "-no-color", "-json"]
+
 def httpx_probe(urls):
     host_path = CLEAN / "hosts.txt"
     host_path.write_text("\n".join(urls), encoding="utf-8")
     alive_path = CLEAN / "alive.json"
-    cmd = [
-        str(HTTPX), "-l", str(host_path),
-        "-sc", "-title", "-tech-detect", "-silent", "-no-color", "-json",
-        "-o", str(alive_path)
-    ]
+    cmd = [str(HTTPX), "-l", str(host_path), *HTTPX_FLAGS, "-o", str(alive_path)]
     log.info("httpx 探测中…")
     subprocess.run(cmd, check=False)
 
@@ -112,42 +339,404 @@ def httpx_probe(urls):
     log.info(f"存活 {len(alive)} 个")
     return alive
 
+def alive_records():
+    alive_path = CLEAN / "alive.json"
+    if not alive_path.exists():
+        return []
+    with open(alive_path, encoding="utf-8") as f:
+        return [json.loads(l) for l in f if l.strip()]
+
+# ---------- 扫描缓存 ----------
+def template_version():
+    """模板树（路径 + mtime + 大小）与 severity 的摘要，模板或扫描范围一变缓存即失效"""
+    root = ROOT / cfg["nuclei"]["templates"]
+    h = hashlib.sha1(cfg["nuclei"]["severity"].encode())
+    for fp in sorted(root.rglob("*.yaml")):
+        st = fp.stat()
+        h.update(f"{fp.relative_to(root)}:{st.st_mtime_ns}:{st.st_size}".encode())
+    return h.hexdigest()[:16]
+
+def fingerprint(rec):
+    # httpx 响应指纹：状态码、标题、技术栈、body 哈希
+    body = (rec.get("hash") or {}).get("body_sha256")
+    parts = [rec.get("status_code"), rec.get("title"), sorted(rec.get("tech") or []), body]
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
+def cache_state(version):
+    """TTL 内的缓存指纹 {url: fingerprint}"""
+    ttl = float(cfg["nuclei"].get("cache_ttl_hours", 24))
+    with sqlite3.connect(DB) as conn:
+        return dict(conn.execute("""
+        SELECT host, fingerprint FROM scan_state
+        WHERE tpl_version=? AND scanned_at >= datetime('now', ?)
+        """, (version, f"-{ttl} hours")))
+
+def cache_pending(records, version, full=False):
+    """只留下新主机、指纹变化或缓存过期的记录"""
+    if full:
+        return records
+    state = cache_state(version)
+    pending = [r for r in records if state.get(r["url"]) != fingerprint(r)]
+    log.info(f"扫描缓存：存活 {len(records)} 个，其中 {len(pending)} 个新增/变化需扫描")
+    return pending
+
+def netloc(s):
+    return urlparse(s).netloc if "://" in s else s.split("/")[0]
+
+def load_findings(fp):
+    # 兼容 -je 的单行数组与 -jsonl 的逐行对象
+    findings = []
+    if fp.exists():
+        with open(fp, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    v = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                findings.extend(v if isinstance(v, list) else [v])
+    return findings
+
+def cache_update(records, version):
+    """扫描成功后把本轮指纹与命中模板写回 scan_state"""
+    hits = {}
+    for v in load_findings(CLEAN / "nuclei.json"):
+        hits.setdefault(netloc(v.get("host") or v.get("matched-at") or ""), set()).add(v.get("template-id"))
+    rows = [(r["url"], version, fingerprint(r), json.dumps(sorted(hits.get(netloc(r["url"]), ()))))
+            for r in records]
+    with sqlite3.connect(DB) as conn:
+        conn.executemany("""
+        INSERT INTO scan_state(host, tpl_version, fingerprint, verdict, scanned_at)
+        VALUES (?,?,?,?,CURRENT_TIMESTAMP)
+        ON CONFLICT(host, tpl_version) DO UPDATE SET
+            fingerprint=excluded.fingerprint, verdict=excluded.verdict, scanned_at=excluded.scanned_at
+        """, rows)
+    log.info(f"扫描缓存已更新 {len(rows)} 个主机")
+
 # ---------- nuclei ----------
-def nuclei_scan():
-    tpl_path   = ROOT / cfg["nuclei"]["templates"]
-    alive_path = ROOT / cfg["paths"]["alive_txt"]
+def nuclei_flags(templates=None, threads=None, rate_limit=None):
+    tpl = templates or [str(ROOT / cfg["nuclei"]["templates"])]
+    return [
+        *[a for t in tpl for a in ("-t", t)],
+        "-severity", cfg["nuclei"]["severity"],
+        "-c", str(threads or cfg["nuclei"]["threads"]),
+        "-rate-limit", str(rate_limit or cfg["nuclei"]["rate_limit"]),
+    ]
+
+def nuclei_scan(targets=None):
+    alive_path = targets or ROOT / cfg["paths"]["alive_txt"]
     if not alive_path.exists() or alive_path.stat().st_size == 0:
         log.warning("无存活目标，跳过 PoC")
-        return
+        return False
 
     json_out = CLEAN / "nuclei.json"
 
     cmd = [
         str(NUCLEI), "-l", str(alive_path),
-        "-t", str(tpl_path),
-        "-severity", cfg["nuclei"]["severity"],
-        "-c", str(cfg["nuclei"]["threads"]),
-        "-rate-limit", str(cfg["nuclei"]["rate_limit"]),
+        *nuclei_flags(),
         "-je", str(json_out)   # ← 只保留 JSON
     ]
     log.info("生成 nuclei.json")
-    subprocess.run(cmd, check=False)
+    return subprocess.run(cmd, check=False).returncode == 0
+
+# ---------- nuclei 分片 ----------
+def template_groups(n):
+    """按目录把模板树切成 n 组（文件数贪心装箱）。
+    nuclei 的 -t 目录是递归的，只有自身不含模板的目录才往下拆，保证各组互不重叠"""
+    root = ROOT / cfg["nuclei"]["templates"]
+    count = {}
+    for fp in root.rglob("*.yaml"):
+        for d in fp.relative_to(root).parents:
+            count[d] = count.get(d, 0) + 1
+    limit = max(1, count.get(Path("."), 0) // (n * 4))
+
+    units = []
+    def split(d):
+        direct = any((root / d).glob("*.yaml"))
+        if count[d] <= limit or direct:
+            units.append((d, count[d]))
+            return
+        for child in sorted((root / d).iterdir()):
+            rel = child.relative_to(root)
+            if child.is_dir() and rel in count:
+                split(rel)
+    split(Path("."))
+
+    groups, sizes = [[] for _ in range(n)], [0] * n
+    for d, cnt in sorted(units, key=lambda u: -u[1]):
+        i = sizes.index(min(sizes))
+        groups[i].append(str(root / d))
+        sizes[i] += cnt
+    return [g for g in groups if g]
+
+def tag_groups():
+    """按 config 里 shard_tags 每组一个分片，另加一个排除全部已列标签的兜底分片"""
+    tags = cfg["nuclei"].get("shard_tags") or []
+    rest = ",".join(t for g in tags for t in g.split(","))
+    return [["-tags", g] for g in tags] + [["-etags", rest]]
+
+def run_plan(plan, workers, label="分片"):
+    """并发执行一组 nuclei 任务 {targets, templates, args, cwd}，threads / rate_limit 按并发数均分；
+    失败的任务单独重试，结果去重合并成 nuclei.json，耗时写入 nuclei_shards.json"""
+    retries = int(cfg["nuclei"].get("shard_retries", 2))
+    shard_dir = CLEAN / "shards"
+    shard_dir.mkdir(exist_ok=True)
+
+    k = max(1, min(workers, len(plan)))
+    threads = max(1, int(cfg["nuclei"]["threads"]) // k)
+    rate    = max(1, int(cfg["nuclei"]["rate_limit"]) // k)
+
+    def run(i):
+        job = plan[i]
+        out = shard_dir / f"shard_{i}.jsonl"
+        cmd = [str(NUCLEI), "-l", str(job["targets"]), *nuclei_flags(job.get("templates"), threads, rate),
+               *job.get("args", []), "-jsonl", "-silent", "-no-color", "-o", str(out)]
+        start = time.time()
+        for attempt in range(1, retries + 2):
+            out.unlink(missing_ok=True)
+            rc = subprocess.run(cmd, check=False, cwd=job.get("cwd")).returncode
+            if rc == 0:
+                break
+            log.warning(f"{label} {i} 第 {attempt} 次失败（rc={rc}）")
+        return {"shard": i, "targets": str(job["targets"]), "templates": job.get("templates"),
+                "args": job.get("args", []), "attempts": attempt, "returncode": rc,
+                "seconds": round(time.time() - start, 2), "output": str(out)}
+
+    log.info(f"nuclei {label}扫描：{len(plan)} 个任务，{k} 个并发进程，每进程 -c {threads} -rate-limit {rate}")
+    with ThreadPoolExecutor(k) as pool:
+        stats = list(pool.map(run, range(len(plan))))
+
+    # 合并去重
+    merged, seen = [], set()
+    for st in stats:
+        st["findings"] = 0
+        fp = Path(st.pop("output"))
+        if not fp.exists():
+            continue
+        with open(fp, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    v = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                key = (v.get("template-id"), v.get("host"), v.get("matched-at"), v.get("matcher-name"))
+                st["findings"] += 1
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(v)
+
+    (CLEAN / "nuclei.json").write_text(json.dumps(merged, ensure_ascii=False), encoding="utf-8")
+    (CLEAN / "nuclei_shards.json").write_text(json.dumps(stats, indent=2, ensure_ascii=False), encoding="utf-8")
+    failed = [st["shard"] for st in stats if st["returncode"] != 0]
+    for st in stats:
+        log.info(f"{label} {st['shard']}: {st['seconds']}s, 尝试 {st['attempts']} 次, 命中 {st['findings']} 条")
+    if failed:
+        log.error(f"{label} {failed} 重试后仍失败，结果不完整")
+    log.info(f"合并去重后 {len(merged)} 条 → nuclei.json")
+    return not failed
+
+def nuclei_scan_sharded(shards=None, by=None, targets=None):
+    """把扫描按目标 / 模板目录 / 标签拆成 n 个 nuclei 进程并发跑"""
+    alive_path = targets or ROOT / cfg["paths"]["alive_txt"]
+    if not alive_path.exists() or alive_path.stat().st_size == 0:
+        log.warning("无存活目标，跳过 PoC")
+        return False
+
+    n  = int(shards or cfg["nuclei"].get("shards", 4))
+    by = by or cfg["nuclei"].get("shard_by", "targets")
+    shard_dir = CLEAN / "shards"
+    shard_dir.mkdir(exist_ok=True)
+
+    if by == "templates":
+        plan = [{"targets": alive_path, "templates": g} for g in template_groups(n)]
+    elif by == "tags":
+        plan = [{"targets": alive_path, "args": extra} for extra in tag_groups()]
+    else:
+        targets = [l for l in alive_path.read_text(encoding="utf-8").splitlines() if l.strip()]
+        plan = []
+        for i in range(n):
+            chunk = targets[i::n]
+            if chunk:
+                fp = shard_dir / f"targets_{i}.txt"
+                fp.write_text("\n".join(chunk), encoding="utf-8")
+                plan.append({"targets": fp})
+    if not plan:
+        log.warning("分片计划为空，跳过 PoC")
+        return False
+    return run_plan(plan, len(plan))
+
+# ---------- 模板预选 ----------
+def asset_frameworks():
+    """fofa_spider 写入的 framework 列，按 ip:port 索引；表里没有该列时返回空"""
+    table, col_ip, col_port = cfg["sqlite"]["table"], cfg["sqlite"]["col_ip"], cfg["sqlite"]["col_port"]
+    with sqlite3.connect(DB) as conn:
+        cols = [c[1] for c in conn.execute(f"PRAGMA table_info({table})")]
+        if "framework" not in cols:
+            return {}
+        return {f"{ip}:{port}": fw for ip, port, fw in conn.execute(
+            f"SELECT {col_ip}, {col_port}, framework FROM {table} WHERE framework IS NOT NULL")}
+
+def nuclei_scan_preselect(records):
+    """按 httpx 技术栈 + fofa framework 给每台主机挑相关模板；模板集相同的主机合成一个任务。
+    识别不出技术栈（或没有相关模板）的主机仍跑全量模板"""
+    tpl_root = ROOT / cfg["nuclei"]["templates"]
+    sev = {s.strip() for s in cfg["nuclei"]["severity"].split(",")}
+    by_key = template_index.invert(template_index.build_index(tpl_root), sev)
+    fws = asset_frameworks()
+
+    groups, fallback = {}, []
+    for r in records:
+        toks = template_index.host_tokens(r.get("tech") or [], fws.get(f"{r.get('host')}:{r.get('port')}"))
+        tpls = template_index.select(by_key, toks)
+        if tpls:
+            groups.setdefault(tuple(tpls), []).append(r["url"])
+        else:
+            fallback.append(r["url"])
+
+    pre_dir = CLEAN / "preselect"
+    pre_dir.mkdir(exist_ok=True)
+    plan = []
+    for i, (tpls, urls) in enumerate(groups.items()):
+        fp = pre_dir / f"targets_{i}.txt"
+        fp.write_text("\n".join(urls), encoding="utf-8")
+        # 相对路径 + cwd=模板根目录，逗号拼接后按长度切块，避开 Windows 命令行 32K 上限
+        chunk = []
+        for t in tpls:
+            if chunk and sum(len(c) + 1 for c in chunk) + len(t) > 20000:
+                plan.append({"targets": fp, "templates": [",".join(chunk)], "cwd": tpl_root})
+                chunk = []
+            chunk.append(t)
+        plan.append({"targets": fp, "templates": [",".join(chunk)], "cwd": tpl_root})
+    if fallback:
+        fp = pre_dir / "targets_full.txt"
+        fp.write_text("\n".join(fallback), encoding="utf-8")
+        plan.append({"targets": fp})
+
+    picked = sum(len(t) * len(u) for t, u in groups.items())
+    log.info(f"模板预选：{len(records) - len(fallback)} 台主机平均 "
+             f"{picked / max(1, len(records) - len(fallback)):.0f} 个模板，{len(fallback)} 台跑全量")
+    if not plan:
+        return False
+    return run_plan(plan, int(cfg["nuclei"].get("shards", 4)), "预选任务")
+
+# ---------- 流式 httpx → nuclei ----------
+def stream_scan(urls, full=False):
+    """httpx 每探测到一个存活 URL 就经 stdin 喂给常驻 nuclei（-stream），
+    nuclei 的 JSONL 结果逐行写入 nuclei.json，两个阶段并行跑"""
+    version = template_version()
+    state   = {} if full else cache_state(version)
+    host_path = CLEAN / "hosts.txt"
+    host_path.write_text("\n".join(urls), encoding="utf-8")
+    alive_path = CLEAN / "alive.json"
+    json_out   = CLEAN / "nuclei.json"
+
+    httpx  = subprocess.Popen([str(HTTPX), "-l", str(host_path), *HTTPX_FLAGS],
+                              stdout=subprocess.PIPE, text=True, encoding="utf-8")
+    nuclei = subprocess.Popen([str(NUCLEI), "-stream", *nuclei_flags(), "-jsonl", "-silent", "-no-color"],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding="utf-8")
+    log.info("httpx → nuclei 流式扫描中…")
+
+    hits = 0
+    def drain():
+        # 独立线程读 nuclei 输出，避免管道写满反压 httpx 一侧
+        nonlocal hits
+        with open(json_out, "w", encoding="utf-8") as out:
+            for line in nuclei.stdout:
+                line = line.strip()
+                if not line.startswith("{"):
+                    continue
+                try:
+                    v = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                out.write(line + "\n")
+                out.flush()
+                hits += 1
+                log.info(f"[{v.get('info', {}).get('severity')}] {v.get('template-id')} {v.get('matched-at')}")
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+
+    alive, pending, fed = [], [], True
+    with open(alive_path, "w", encoding="utf-8") as f:
+        for line in httpx.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+                url = rec["url"]
+            except (json.JSONDecodeError, KeyError):
+                continue
+            f.write(line + "\n")
+            alive.append(url)
+            if state.get(url) == fingerprint(rec):
+                continue        # 指纹未变且缓存未过期
+            pending.append(rec)
+            if fed:
+                try:
+                    nuclei.stdin.write(url + "\n")
+                    nuclei.stdin.flush()
+                except BrokenPipeError:
+                    log.error("nuclei 提前退出，后续目标只做存活探测")
+                    fed = False
+    httpx.wait()
+    try:
+        nuclei.stdin.close()
+    except BrokenPipeError:
+        pass
+    (ROOT / cfg["paths"]["alive_txt"]).write_text("\n".join(alive), encoding="utf-8")
+    log.info(f"存活 {len(alive)} 个，其中 {len(pending)} 个送 nuclei，等待收尾…")
+
+    nuclei.wait()
+    reader.join()
+    log.info(f"nuclei 命中 {hits} 条 → {json_out}")
+    if fed and nuclei.returncode == 0:
+        cache_update(pending, version)
+    return alive
 
 # ---------- main ----------
+def scan(args):
+    # 只把新增/变化的主机送 nuclei，其余沿用 scan_state 里的结论
+    version = template_version()
+    pending = cache_pending(alive_records(), version, args.full)
+    if not pending:
+        (CLEAN / "nuclei.json").write_text("[]", encoding="utf-8")
+        log.info("全部主机命中扫描缓存，跳过 nuclei")
+        return
+    targets = CLEAN / "scan_targets.txt"
+    targets.write_text("\n".join(r["url"] for r in pending), encoding="utf-8")
+    if args.preselect or cfg["nuclei"].get("preselect"):
+        ok = nuclei_scan_preselect(pending)
+    elif args.shards and args.shards > 1:
+        ok = nuclei_scan_sharded(args.shards, args.shard_by, targets)
+    else:
+        ok = nuclei_scan(targets)
+    if ok:
+        cache_update(pending, version)
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-d", "--debug", action="store_true", help="调试日志")
+    parser.add_argument("--paged", action="store_true", help="FOFA 分页并发拉取（可断点续拉）")
+    parser.add_argument("--delta", action="store_true", help="FOFA 增量同步，只拉上次同步之后更新的资产")
+    parser.add_argument("--stream", action="store_true", help="httpx 与 nuclei 流式并行")
+    parser.add_argument("--shards", type=int, help="nuclei 分片进程数（>1 启用分片扫描）")
+    parser.add_argument("--shard-by", choices=["targets", "templates", "tags"], help="分片方式")
+    parser.add_argument("--full", action="store_true", help="忽略扫描缓存，全部主机重扫")
+    parser.add_argument("--preselect", action="store_true", help="按主机技术栈预选 nuclei 模板")
     args = parser.parse_args()
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
 
-    urls = fofa_fetch()
+    urls = fofa_fetch_delta() if args.delta else fofa_fetch_paged() if args.paged else fofa_fetch()
     if not urls:
         log.error("无资产，终止")
         return
-    alive = httpx_probe(urls)
-    if alive:
-        nuclei_scan()
+    if args.stream:
+        stream_scan(urls, args.full)
+    else:
+        alive = httpx_probe(urls)
+        if alive:
+            scan(args)
     log.info("全部完成 ✅")
 
 if __name__ == "__main__":
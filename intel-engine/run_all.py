@@ -14,23 +14,18 @@ def ok(msg):
     print(f"{Fore.CYAN}✅ {msg}{Style.RESET_ALL}")
 
 step("1/5 资产发现 + nuclei")
-subprocess.run([venv_python, "recon.py"])
+subprocess.run([venv_python, "recon.py", *sys.argv[1:]])   # 透传 --full / --stream 等参数
 
 step("2/5 PoC 框架去重 / 二次验证")
-subprocess.run([venv_python, "poc-framework/main.py"])
+subprocess.run([venv_python, "poc-framework/runner.py"])   # pocs/ 插件并发验证 → clean/poc.json
+subprocess.run([venv_python, "poc-framework/main.py", "--export"])   # 增量入库 intel.db 的 vulns 表，再导出 final_vulns.json
 
 step("3/5 模型训练")
-subprocess.run([venv_python, "train.py"])                              
+subprocess.run([venv_python, "train.py"])   # 只在模型过期（默认 7 天）或节点数漂移超 20% 时重训，否则沿用
 
 step("4/5 风险预测")
-import subprocess, pathlib as pl
-
-base = pl.Path(r"D:\pythonProject1")
-venv_python = base / ".venv/Scripts/python.exe"
-script      = base / "intel-engine/predict.py"
-json_file   = base / "intel-engine/clean/final_vulns.json"
-
-subprocess.run([str(venv_python), str(script), str(json_file)], check=True)
+# 只重算变化节点的 3 跳邻域，分数写入 intel.db 的 risk_scores（看板与下次 --export 按 ip 关联）
+subprocess.run([venv_python, "predict.py", "--incremental", "clean/final_vulns.json"], check=True)
 
 step("5/5 打开 Streamlit 看板")
 # 自动用 localhost，避免 0.0.0.0 网络解析失败
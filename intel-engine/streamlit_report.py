@@ -2,10 +2,11 @@
 import streamlit as st
 import pandas as pd
 from pathlib import Path
-import json
+import json, math, sqlite3
 
 ROOT = Path(__file__).parent
 JSON_PATH = ROOT / "clean" / "final_vulns.json"
+DB = ROOT / "intel.db"            # predict.py --incremental 把最新风险分写在 risk_scores 表
 
 st.set_page_config(
     page_title="实时漏洞扫描看板",
@@ -41,36 +42,74 @@ if not JSON_PATH.exists():
     st.info("🎉 当前未发现任何漏洞，请稍后再试")
     st.stop()
 
-# ---------- 读取 & 拉平 ----------
-with open(JSON_PATH, "r", encoding="utf-8") as f:
-    raw = json.load(f)
-
-records = []
-for item in raw:
-    if isinstance(item, list):
-        records.extend(item)
-    elif isinstance(item, dict):
-        records.append(item)
-
-# ---------- 统一字段 ----------
-rows = []
-for r in records:
-    rows.append({
-        "Host": r.get("host") or r.get("matched-at") or "-",
-        "Name": r.get("info", {}).get("name") or r.get("template-id") or "-",
-        "Severity": r.get("severity") or "unknown",
-        "Matched-At": r.get("matched-at") or r.get("host") or "-",
-        "Timestamp": r.get("timestamp") or pd.Timestamp.now().isoformat(),
-        "RiskScore": round(r.get("risk_score", 0), 3),
+# ---------- 读取 & 拉平（按文件 mtime / size 缓存，文件不变时 rerun 直接命中） ----------
+def query_scores(sql):
+    try:
+        with sqlite3.connect(f"file:{DB}?mode=ro", uri=True) as conn:
+            return conn.execute(sql).fetchall()
+    except sqlite3.Error:
+        return []
+
+def scores_version():
+    """risk_scores 有更新时变化，作 load_vulns 的缓存键"""
+    return tuple(next(iter(query_scores("SELECT COUNT(*), MAX(scored_at) FROM risk_scores")), ()))
+
+@st.cache_data(show_spinner="加载漏洞数据…", max_entries=2)
+def load_vulns(path: str, mtime_ns: int, size: int, scores_ver: tuple = ()):
+    """final_vulns.json → 列式 DataFrame + 预聚合指标；mtime_ns / size / scores_ver 只作缓存键。
+    风险分优先取 risk_scores 表，predict.py 打完分不用等下次导出就能看到"""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    scores = dict(query_scores("SELECT ip, score FROM risk_scores")) if scores_ver else {}
+
+    records = []
+    for item in raw:
+        if isinstance(item, list):
+            records.extend(item)
+        elif isinstance(item, dict):
+            records.append(item)
+
+    # ---------- 统一字段：一次遍历直接攒列 ----------
+    now = pd.Timestamp.now().isoformat()
+    host, name, sev, matched, ts, risk = [], [], [], [], [], []
+    for r in records:
+        h = r.get("host") or r.get("matched-at") or "-"
+        host.append(h)
+        name.append((r.get("info") or {}).get("name") or r.get("template-id") or "-")
+        sev.append((r.get("severity") or "unknown").lower())
+        matched.append(r.get("matched-at") or r.get("host") or "-")
+        ts.append(r.get("timestamp") or now)
+        ip = h.partition(":")[0]
+        # 0.0 也是有效分数，只有 risk_scores 里没有这个 ip 时才退回 JSON 里的旧分
+        risk.append(scores[ip] if ip in scores else (r.get("risk_score") or 0))
+
+    df = pd.DataFrame({
+        "Host": host,
+        "Name": name,
+        "Severity": pd.Series(sev, dtype="category"),
+        "Matched-At": matched,
+        "Timestamp": ts,
+        "RiskScore": pd.Series(risk, dtype="float64").round(3),
     })
+    stats = {
+        "total": len(df),
+        "by_sev": df["Severity"].value_counts().to_dict(),
+        "max_risk": float(df["RiskScore"].max()) if len(df) else 0.0,
+    }
+    return df, stats
+
+@st.cache_data(max_entries=1)
+def raw_bytes(path: str, mtime_ns: int, size: int):
+    return Path(path).read_bytes()
 
-df_vis = pd.DataFrame(rows)
+stat = JSON_PATH.stat()
+df_vis, stats = load_vulns(str(JSON_PATH), stat.st_mtime_ns, stat.st_size, scores_version())
 
 # ---------- 顶部指标 ----------
-total = len(df_vis)
-critical = (df_vis["Severity"].str.lower() == "critical").sum()
-high = (df_vis["Severity"].str.lower() == "high").sum()
-max_risk = df_vis["RiskScore"].max()
+total = stats["total"]
+critical = stats["by_sev"].get("critical", 0)
+high = stats["by_sev"].get("high", 0)
+max_risk = stats["max_risk"]
 
 col1, col2, col3, col4 = st.columns(4)
 with col1:
@@ -82,7 +121,7 @@ with col3:
 with col4:
     st.metric("GNN 风险分", f"{max_risk:.3f}")
 
-# ---------- 明细表 ----------
+# ---------- 明细表（分页，只给当前页上色） ----------
 st.markdown("### 🔎 漏洞明细")
 with st.expander("点击展开 / 折叠", expanded=True):
 
@@ -96,48 +135,36 @@ with st.expander("点击展开 / 折叠", expanded=True):
         color = cmap.get(str(val).lower(), "#9e9e9e")
         return f"background-color:{color};color:#fff;border-radius:4px;padding:2px 6px;"
 
+    c1, c2, c3 = st.columns([1, 1, 4])
+    page_size = c1.selectbox("每页条数", [50, 100, 200, 500], index=1)
+    pages = max(1, math.ceil(total / page_size))
+    page = c2.number_input("页码", min_value=1, max_value=pages, value=1, step=1)
+    c3.caption(f"共 {total} 条，第 {page} / {pages} 页")
+
+    page_df = df_vis.iloc[(page - 1) * page_size: page * page_size]
     styled = (
-        df_vis.style.map(color_severity, subset=["Severity"])
+        page_df.style.map(color_severity, subset=["Severity"])
         .set_properties(**{"text-align": "left"})
         .set_table_styles([{"selector": "th", "props": [("text-align", "left")]}])
     )
     st.dataframe(styled, use_container_width=True, height=420)
 
 # ---------- 下载 ----------
-with open(JSON_PATH, "rb") as f:
-    st.download_button(
-        label="📥 下载 JSON",
-        data=f,
-        file_name="final_vulns.json",
-        mime="application/json",
-    )
+st.download_button(
+    label="📥 下载 JSON",
+    data=raw_bytes(str(JSON_PATH), stat.st_mtime_ns, stat.st_size),
+    file_name="final_vulns.json",
+    mime="application/json",
+)
 
 
-# graph_view.py
-import streamlit as st
+# ---------- 关系图：每个 /24 聚合成一个超级节点，选中网段后再展开到主机 ----------
 import streamlit.components.v1 as components
-import pandas as pd
 import networkx as nx
 from pyvis.network import Network
-import json, ipaddress
-from pathlib import Path
 
-ROOT = Path(__file__).parent
-JSON_PATH = ROOT / "clean" / "final_vulns.json"
-
-st.set_page_config(page_title="漏洞关系图", layout="wide")
 st.markdown("## 🔗 漏洞-主机 关系图")
 
-if not JSON_PATH.exists():
-    st.warning("暂无漏洞数据")
-    st.stop()
-
-# 1. 读 JSON
-with open(JSON_PATH, encoding="utf-8") as f:
-    vulns = json.load(f)
-
-# 2. 建图
-G = nx.Graph()
 SEV_COLOR = {
     "critical": "#d32f2f",
     "high": "#ff9800",
@@ -146,28 +173,79 @@ SEV_COLOR = {
     "info": "#17a2b8",
     "unknown": "#9e9e9e"
 }
+SEV_NAMES = list(SEV_COLOR)                        # 下标即严重程度排名，0 最重
+
+@st.cache_data(max_entries=2)
+def host_table(path: str, mtime_ns: int, size: int):
+    """每个 IP 一行：最重 severity、漏洞数、代表漏洞名、所属 /24（非 IPv4 自成一组）"""
+    df, _ = load_vulns(path, mtime_ns, size)
+    rank = df["Severity"].astype(str).map({s: i for i, s in enumerate(SEV_NAMES)}).fillna(len(SEV_NAMES) - 1)
+    hosts = (
+        # 空文件时 Host 列是 float 空列，.str 会报错，先转成字符串
+        pd.DataFrame({"ip": df["Host"].astype(str).str.split(":").str[0], "rank": rank, "name": df["Name"]})
+        .groupby("ip", sort=False)
+        .agg(rank=("rank", "min"), vulns=("rank", "size"), name=("name", "first"))
+        .reset_index()
+    )
+    v4 = hosts["ip"].str.fullmatch(r"\d{1,3}(?:\.\d{1,3}){3}")
+    hosts["subnet"] = (hosts["ip"].str.rsplit(".", n=1).str[0] + ".0/24").where(v4, hosts["ip"])
+    return hosts
+
+@st.cache_data(max_entries=2)
+def subnet_table(path: str, mtime_ns: int, size: int):
+    """按网段聚合，最危险、漏洞最多的排在前面"""
+    return (
+        host_table(path, mtime_ns, size)
+        .groupby("subnet")
+        .agg(rank=("rank", "min"), hosts=("ip", "size"), vulns=("vulns", "sum"))
+        .reset_index()
+        .sort_values(["rank", "vulns"], ascending=[True, False], ignore_index=True)
+    )
 
-for v in vulns:
-    host = v.get("host") or v.get("matched-at", "-")
-    ip   = host.split(":")[0]
-    sev  = v.get("severity", "unknown").lower()
-    title = v.get("info", {}).get("name") or v.get("template-id", "-")
-    G.add_node(ip,
-               label=ip,
-               color=SEV_COLOR.get(sev, "#ccc"),
-               title=f"{title}\n{sev.upper()}")
-    # 同 /24 建边
-    for other in list(G.nodes):
-        if other != ip and ipaddress.ip_network(f"{ip}/24", strict=False) == \
-                          ipaddress.ip_network(f"{other}/24", strict=False):
-            G.add_edge(ip, other)
-
-# 3. 生成 HTML
-net = Network(height="600px", width="100%", bgcolor="#222222", font_color="white")
-net.from_nx(G)
-net.save_graph(str(ROOT / "clean" / "vuln_graph.html"))
-
-# 4. 嵌入 Streamlit
-HtmlFile = open(ROOT / "clean" / "vuln_graph.html", "r", encoding="utf-8")
-source_code = HtmlFile.read()
-components.html(source_code, height=650, scrolling=True)
\ No newline at end of file
+@st.cache_data(max_entries=32)
+def graph_html(path: str, mtime_ns: int, size: int, top_n: int, expand: str | None):
+    """超级节点图的 HTML；布局在服务端算好后固定（关闭 physics），同一组参数直接命中缓存"""
+    subnets = subnet_table(path, mtime_ns, size)
+    shown = subnets.head(top_n)
+    if expand and expand not in set(shown["subnet"]):
+        shown = pd.concat([shown, subnets[subnets["subnet"] == expand]])
+
+    G = nx.Graph()
+    for s in shown.itertuples():
+        sev = SEV_NAMES[int(s.rank)]
+        G.add_node(s.subnet, label=f"{s.subnet} ({s.hosts})", color=SEV_COLOR[sev],
+                   size=10 + 4 * math.log2(s.hosts), title=f"{s.hosts} 台主机 / {s.vulns} 个漏洞\n最高 {sev.upper()}")
+        # 同一 /16 的网段挂到一个小枢纽上，边数与网段数线性
+        if s.subnet.endswith("/24"):
+            b16 = ".".join(s.subnet.split(".")[:2]) + ".0.0/16"
+            G.add_node(b16, label=b16, color="#555555", size=5)
+            G.add_edge(b16, s.subnet)
+
+    if expand:
+        hosts = host_table(path, mtime_ns, size)
+        for h in hosts[hosts["subnet"] == expand].itertuples():
+            sev = SEV_NAMES[int(h.rank)]
+            G.add_node(h.ip, label=h.ip, color=SEV_COLOR[sev], size=8,
+                       title=f"{h.name}\n{sev.upper()}（{h.vulns} 个漏洞）")
+            G.add_edge(expand, h.ip)
+
+    pos = nx.spring_layout(G, seed=42, scale=1000)
+    net = Network(height="600px", width="100%", bgcolor="#222222", font_color="white")
+    net.from_nx(G)
+    for n in net.nodes:
+        n["x"], n["y"] = (float(v) for v in pos[n["id"]])
+    net.toggle_physics(False)
+    return net.generate_html()
+
+subnets = subnet_table(str(JSON_PATH), stat.st_mtime_ns, stat.st_size)
+c1, c2 = st.columns([1, 3])
+n_sub = len(subnets)
+top_n = c1.number_input("显示网段数（按危险程度排序）", min_value=1, max_value=max(1, n_sub),
+                        value=min(200, max(1, n_sub)), step=50)
+options = ["（不展开）"] + subnets["subnet"].tolist()
+expand = c2.selectbox("展开网段", options)
+c2.caption(f"共 {n_sub} 个网段、{len(host_table(str(JSON_PATH), stat.st_mtime_ns, stat.st_size))} 台主机")
+
+html = graph_html(str(JSON_PATH), stat.st_mtime_ns, stat.st_size, int(top_n),
+                  None if expand == options[0] else expand)
+components.html(html, height=650, scrolling=True)
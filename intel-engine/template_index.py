@@ -0,0 +1,124 @@
+# template_index.py
+"""
+template_index.py  -- nuclei 模板索引 + 按资产技术栈预选模板
+索引落盘到 clean/template_index.json，按文件 mtime 增量更新，只重解析改动过的模板
+"""
+import json, re, yaml
+from pathlib import Path
+
+ROOT = Path(__file__).parent
+INDEX_PATH = ROOT / "clean" / "template_index.json"
+
+# 有 libyaml 时用 C 版解析，首次建索引快一个数量级
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# 技术栈里过于宽泛、不能用来挑模板的词
+GENERIC = {"http", "https", "web", "server", "ssl", "tls", "cdn", "html", "html5", "hsts"}
+
+
+def norm(s):
+    return re.sub(r"[\s_]+", "-", str(s).strip().lower())
+
+
+def parse_template(fp):
+    """抽取 id / tags / severity / 产品；不是模板（profiles 等）返回 None"""
+    try:
+        doc = yaml.load(fp.read_text(encoding="utf-8"), Loader=Loader)
+    except (yaml.YAMLError, UnicodeDecodeError):
+        return None
+    if not isinstance(doc, dict) or "id" not in doc:
+        return None
+    info = doc.get("info") or {}
+    tags = info.get("tags") or []
+    if isinstance(tags, str):
+        tags = tags.split(",")
+
+    products = set()
+    meta = info.get("metadata") or {}
+    for k in ("vendor", "product"):
+        v = meta.get(k)
+        products.update(v if isinstance(v, list) else [v] if v else [])
+    # cpe:2.3:a:apache:solr:*:... → apache / solr
+    cpe = (info.get("classification") or {}).get("cpe") or ""
+    parts = cpe.split(":")
+    if len(parts) > 4:
+        products.update(p for p in parts[3:5] if p not in ("*", "-"))
+
+    return {
+        "id": doc["id"],
+        "tags": sorted({norm(t) for t in tags if str(t).strip()}),
+        "severity": str(info.get("severity", "unknown")).lower(),
+        "products": sorted({norm(p) for p in products}),
+    }
+
+
+def build_index(tpl_root, index_path=INDEX_PATH):
+    """{相对路径: 条目}；mtime 没变的条目直接沿用旧索引"""
+    tpl_root = Path(tpl_root)
+    old = {}
+    if index_path.exists():
+        try:
+            cached = json.loads(index_path.read_text(encoding="utf-8"))
+            if cached.get("root") == str(tpl_root.resolve()):
+                old = cached["templates"]
+        except (json.JSONDecodeError, KeyError):
+            pass
+
+    entries, changed = {}, 0
+    for fp in tpl_root.rglob("*.yaml"):
+        rel = fp.relative_to(tpl_root).as_posix()
+        mtime = fp.stat().st_mtime_ns
+        e = old.get(rel)
+        if e is None or e["mtime"] != mtime:
+            # 非模板也记一条空壳，避免每次都重新解析
+            e = parse_template(fp) or {"id": None}
+            e["mtime"] = mtime
+            changed += 1
+        entries[rel] = e
+
+    if changed or len(entries) != len(old):
+        index_path.parent.mkdir(exist_ok=True)
+        index_path.write_text(json.dumps({"root": str(tpl_root.resolve()), "templates": entries},
+                                         ensure_ascii=False), encoding="utf-8")
+    return entries
+
+
+def invert(entries, severities=None):
+    """倒排：tag / 产品 → 模板相对路径集合，可按 severity 预先过滤"""
+    by_key = {}
+    for rel, e in entries.items():
+        if not e.get("id"):
+            continue
+        if severities and e["severity"] not in severities:
+            continue
+        for k in (*e["tags"], *e["products"]):
+            by_key.setdefault(k, set()).add(rel)
+    return by_key
+
+
+def host_tokens(tech=(), framework=None):
+    """httpx -tech-detect（如 "Nginx:1.18.0"、"Apache Solr"）+ fofa framework → 匹配词"""
+    toks = set()
+    for t in [*tech, framework]:
+        if not t:
+            continue
+        name = norm(str(t).split(":")[0])
+        if not name:
+            continue
+        toks.add(name)
+        toks.update(p for p in name.split("-") if len(p) >= 3)
+    return toks - GENERIC
+
+
+def select(by_key, tokens):
+    hit = set()
+    for t in tokens:
+        hit |= by_key.get(t, set())
+    return sorted(hit)
+
+
+if __name__ == "__main__":
+    import sys, time
+    t0 = time.time()
+    idx = build_index(ROOT / (sys.argv[1] if len(sys.argv) > 1 else "nuclei-templates"))
+    print(f"模板 {sum(1 for e in idx.values() if e.get('id'))} 个，索引耗时 {time.time() - t0:.2f}s → {INDEX_PATH}")
@@ -1,24 +1,120 @@
-import streamlit as st, pandas as pd, sqlite3
+import streamlit as st, pandas as pd, sqlite3, math
 from pathlib import Path
 
 ROOT = Path(__file__).parent
 DB = ROOT / ".."/ "intel.db"           # ← 指向 FOFA 资产库
 NUCLEI_JSON = ROOT / ".." / "clean" / "final_vulns.json"
 
+ASSET_COLS = ["ip", "port", "protocol", "host", "title", "banner", "framework", "last_seen"]
+INDEX_COLS = ["ip", "port", "framework", "last_seen"]
+PAGE_SIZE = 100
+
 st.set_page_config(page_title="FOFA 资产 & 漏洞总览", layout="wide")
 st.title("📊 FOFA 资产 + nuclei 漏洞总览")
 
+
+# ---------- 数据访问：过滤 / 分页都下推到 SQL，页面耗时与库大小无关 ----------
+@st.cache_resource
+def ensure_indexes():
+    """进程内只跑一次：用一个短连接按实际存在的列补索引，查询连接保持只读"""
+    conn = sqlite3.connect(DB)
+    try:
+        for table, cols in (("assets", INDEX_COLS), ("vulns", ["severity"])):
+            have = table_columns(conn, table)
+            for c in cols:
+                if c in have:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{c} ON {table}({c})")
+        conn.commit()
+    finally:
+        conn.close()
+    return True
+
+def get_conn():
+    """每个浏览器会话一个只读查询连接，存在 session_state 里，会话之间不共用；
+    同一会话的 rerun 可能换脚本线程，所以仍关掉 check_same_thread（会话内不会并发）"""
+    ensure_indexes()
+    if "db_conn" not in st.session_state:
+        st.session_state.db_conn = sqlite3.connect(f"file:{DB}?mode=ro", uri=True, check_same_thread=False)
+    return st.session_state.db_conn
+
+def table_columns(conn, table):
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+
+@st.cache_data(ttl=300)
+def cached_count(sql, params, version):
+    """COUNT(*) 全表扫描代价高，按 (查询, 参数, 库版本) 缓存；version 取 max(rowid)，有新数据即失效"""
+    return get_conn().execute(sql, params).fetchone()[0]
+
+@st.cache_data(ttl=300)
+def distinct_values(table, col, version):
+    """走索引取去重值，用于下拉框"""
+    return [r[0] for r in get_conn().execute(
+        f"SELECT DISTINCT {col} FROM {table} WHERE {col} IS NOT NULL AND {col} != '' ORDER BY {col} LIMIT 500")]
+
+def version(conn, table):
+    return conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+
+def page_query(conn, table, cols, where, params, page, order="rowid"):
+    sql = f"SELECT {', '.join(cols)} FROM {table}{where} ORDER BY {order} LIMIT ? OFFSET ?"
+    return pd.read_sql(sql, conn, params=(*params, PAGE_SIZE, (page - 1) * PAGE_SIZE))
+
+def pager(key, total):
+    pages = max(1, math.ceil(total / PAGE_SIZE))
+    page = st.number_input("页码", min_value=1, max_value=pages, value=1, step=1, key=key)
+    st.caption(f"共 {total} 条，第 {page} / {pages} 页，每页 {PAGE_SIZE} 条")
+    return page
+
+
+conn = get_conn()
+
 # 1️⃣ 资产清单（来自 FOFA）
 with st.expander("🗂 FOFA 资产"):
-    conn = sqlite3.connect(DB)
-    assets = pd.read_sql("SELECT ip,port,protocol,host,title,banner FROM assets", conn)
-    conn.close()
-    st.metric("资产数量", len(assets))
-    st.dataframe(assets, use_container_width=True)
+    have = table_columns(conn, "assets")
+    if not have:
+        st.info("暂无资产")
+    else:
+        cols = [c for c in ASSET_COLS if c in have]
+        ver = version(conn, "assets")
+        c1, c2, c3, c4 = st.columns(4)
+        ip_prefix = c1.text_input("IP 前缀", placeholder="如 10.0.")
+        port = c2.text_input("端口")
+        framework = c3.selectbox("框架", ["全部"] + distinct_values("assets", "framework", ver)) \
+            if "framework" in have else "全部"
+        since = c4.date_input("最近出现不早于", value=None) if "last_seen" in have else None
+
+        conds, params = [], []
+        if ip_prefix.strip():
+            # GLOB 区分大小写，可以走 ip 上的普通索引做前缀范围扫描
+            conds.append("ip GLOB ?")
+            params.append(ip_prefix.strip().translate(str.maketrans("", "", "*?[]")) + "*")
+        if port.strip():
+            conds.append("port = ?")
+            params.append(port.strip())
+        if framework != "全部":
+            conds.append("framework = ?")
+            params.append(framework)
+        if since:
+            conds.append("last_seen >= ?")
+            params.append(since.isoformat())
+        where = f" WHERE {' AND '.join(conds)}" if conds else ""
+
+        total = cached_count(f"SELECT COUNT(*) FROM assets{where}", tuple(params), ver)
+        st.metric("资产数量", total)
+        page = pager("assets_page", total)
+        st.dataframe(page_query(conn, "assets", cols, where, params, page), use_container_width=True)
 
-# 2️⃣ 漏洞清单（来自 nuclei）
+# 2️⃣ 漏洞清单（来自 poc-framework/main.py 维护的 vulns 表）
 with st.expander("🚨 漏洞清单"):
-    if NUCLEI_JSON.exists():
+    if table_columns(conn, "vulns"):
+        ver = version(conn, "vulns")
+        sev = st.selectbox("严重级别", ["全部"] + distinct_values("vulns", "severity", ver))
+        where, params = (" WHERE severity = ?", (sev,)) if sev != "全部" else ("", ())
+        total = cached_count(f"SELECT COUNT(*) FROM vulns{where}", params, ver)
+        st.metric("漏洞数量", total)
+        page = pager("vulns_page", total)
+        st.dataframe(page_query(conn, "vulns", ["host", "template_id", "severity", "first_seen", "last_seen"],
+                                where, params, page, order="id"), use_container_width=True)
+    elif NUCLEI_JSON.exists():
         vulns = pd.read_json(NUCLEI_JSON)
         st.metric("漏洞数量", len(vulns))
         st.dataframe(vulns, use_container_width=True)
@@ -28,4 +124,4 @@ with st.expander("🚨 漏洞清单"):
 # 3️⃣ 一键下载
 if NUCLEI_JSON.exists():
     with open(NUCLEI_JSON, "rb") as f:
-        st.download_button("📥 导出漏洞 JSON", f, "final_vulns.json", "application/json")
\ No newline at end of file
+        st.download_button("📥 导出漏洞 JSON", f, "final_vulns.json", "application/json")
@@ -1,29 +1,388 @@
 #!/usr/bin/env python3
-import sqlite3, json
+"""
+tools/enrich.py  -- 资产 banner → CVE 关联
+关键词字典由 vuln-db/std/vuln.db 的 vuln 表生成（描述里的产品名，以及「产品/版本」精确词），编译成
+Aho–Corasick 自动机；assets 按块流式读出，每条 title + banner 只扫一遍，耗时与关键词数量无关。
+banner 里带版本的产品（"nginx/1.18.0"、httpx 的 "Nginx:1.18.0"）再查 cve_nvd 爬下来的 cpe_match 版本区间：
+区间命中的 CVE 记为精确关联；版本已知但不在受影响区间内的，丢弃只靠产品名命中的关联。
+命中写入 intel.db 的 asset_cves 表，(ip, port, cve) 唯一；本轮没再命中的旧关联会被清掉
+装了 pyahocorasick 走 C 实现，否则退回纯 Python 版
+用法：python tools/enrich.py [--chunk 20000]
+      python tools/enrich.py --lookup nginx/1.18.0      # 只查某个产品版本受哪些 CVE 影响
+"""
+import argparse, re, sqlite3, time, yaml
+from bisect import bisect_left
+from collections import Counter, defaultdict, deque
 from pathlib import Path
 
-ROOT = Path(__file__).parent
-DB = ROOT / ".." / "intel.db"  
-OUT = ROOT / ".." / "clean" / "enriched.json"
+ROOT = Path(__file__).parent.parent
+cfg = yaml.safe_load(open(ROOT / "config.yaml", encoding="utf-8"))
+DB = ROOT / cfg["sqlite"]["db"]
+VULN_DB = ROOT / "db" / "vuln-db" / "std" / "vuln.db"
+CHUNK = 20000
 
-conn = sqlite3.connect(DB)
-cur = conn.cursor()
+try:
+    import ahocorasick
+    Automaton = ahocorasick.Automaton
+except ImportError:
+    ahocorasick = None
 
-# 根据 banner 匹配 CVE 字典（示例）
-banner_map = {
-    "thinkphp": ["CVE-2021-46379"],
-    "grafana":  ["CVE-2021-43798"],
+
+# ---------- 纯 Python 版自动机（接口与 pyahocorasick 的 Automaton 一致的子集） ----------
+if ahocorasick is None:
+    class Automaton:
+        def __init__(self):
+            self.goto = [{}]
+            self.fail = [0]
+            self.out = [[]]
+            self.words = 0             # 关键词数；enrich_text 每行都要判空，__len__ 不能遍历状态
+
+        def add_word(self, word, value):
+            s = 0
+            for ch in word:
+                nxt = self.goto[s].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[s][ch] = nxt
+                    self.goto.append({}); self.fail.append(0); self.out.append([])
+                s = nxt
+            self.out[s].append(value)
+            self.words += 1
+            return True
+
+        def make_automaton(self):
+            """BFS 建 fail 链，并把 fail 状态的输出并进来，匹配时不用再沿 fail 链回溯"""
+            q = deque(self.goto[0].values())
+            while q:
+                s = q.popleft()
+                for ch, t in self.goto[s].items():
+                    q.append(t)
+                    f = self.fail[s]
+                    while f and ch not in self.goto[f]:
+                        f = self.fail[f]
+                    self.fail[t] = self.goto[f].get(ch, 0) if self.goto[f].get(ch) != t else 0
+                    self.out[t] = self.out[t] + self.out[self.fail[t]]
+
+        def iter(self, text):
+            goto, fail, out = self.goto, self.fail, self.out
+            s = 0
+            for i, ch in enumerate(text):
+                while s and ch not in goto[s]:
+                    s = fail[s]
+                s = goto[s].get(ch, 0)
+                for v in out[s]:
+                    yield i, v
+
+        def __len__(self):
+            return self.words
+
+
+# ---------- 从描述里抽关键词 ----------
+VERSION = re.compile(r"v?(\d+(?:\.\d+)+[a-z0-9-]*)$", re.I)
+CUES = {"prior", "before", "through", "up", "version", "versions", "is", "allows", "contains", "was", "has"}
+LEAD_STOP = {"the", "a", "an", "in", "on", "multiple", "unauthenticated", "authenticated", "remote",
+             "improper", "missing", "incorrect", "insecure", "stored", "reflected", "broken", "type",
+             "this", "affected", "vulnerability", "issue", "cross-site", "sql", "path", "server-side",
+             "request", "unrestricted", "inc", "ltd", "llc", "co", "input", "during", "cross", "site",
+             "dom-based"}
+VULN_WORDS = {"rce", "xss", "csrf", "ssrf", "sqli", "lfi", "rfi", "xxe", "jndi", "injection", "exposure",
+              "deserialization", "traversal", "bypass", "disclosure", "overflow", "vulnerability", "unauth",
+              "unauthorized", "dos", "exploit", "leak", "upload", "forgery", "scripting", "authorization",
+              "authentication", "neutralization", "confusion", "execution", "corruption"}
+# 单独出现太泛的词，不作为产品关键词
+GENERIC = {"system", "server", "management", "site", "plugin", "theme", "manager", "portal", "service",
+           "application", "software", "platform", "edition", "enterprise", "framework", "module",
+           "component", "device", "devices", "firmware", "router", "online", "open", "core", "pro",
+           "free", "lite", "admin", "panel", "center", "suite", "project", "shop", "store", "library",
+           "version", "wordpress", "linux", "windows", "microsoft", "google", "apache", "cisco", "http",
+           "https", "html", "page", "user", "users", "file", "files", "data", "access", "control",
+           "content", "network", "security", "client", "api", "login", "form", "mobile", "cloud", "tool",
+           "object", "chat", "code", "command", "remote", "request", "technology", "generation",
+           "analysis", "studio", "learning", "addons", "firewall", "esr", "cross-site", "guardian",
+           "block", "path", "information"}
+WP_PLUGIN = re.compile(r"\bThe (.{3,60}?) (?:plugin|theme) for WordPress")
+MIN_LEN = 4
+
+
+def is_name(tok):
+    return bool(re.fullmatch(r"[A-Za-z][\w+.-]*", tok)) and any(c.isupper() for c in tok) \
+        and tok.lower() not in CUES
+
+
+def product_phrases(desc):
+    """「大写开头的词串」后面紧跟版本号或 before / prior to / through / up to 等提示词时，视为产品名；
+    以漏洞类型词结尾的词串（如 "Apache Tomcat RCE"）去掉尾部后也算。返回 [(产品名, 版本或 None)]"""
+    toks = desc.split()
+    out, i = [], 0
+    while i < len(toks):
+        run, j, closed = [], i, False
+        while j < len(toks) and not closed:
+            tok = toks[j].rstrip(",.;:)")
+            if not is_name(tok.lstrip("(")):
+                break
+            run.append(tok.lstrip("("))
+            closed = tok != toks[j]                # 带了标点，词串到此为止
+            j += 1
+        if not run:
+            i += 1
+            continue
+        nxt = toks[j].rstrip(",.;:)") if j < len(toks) and not closed else ""
+        m = VERSION.match(nxt) if nxt else None
+        cue = m is not None or nxt.lower() in CUES
+        while run and (run[0].lower() in LEAD_STOP or run[0].endswith("'s")):
+            run.pop(0)
+        trimmed = False
+        while run and run[-1].lower() in VULN_WORDS:
+            run.pop(); trimmed = True
+        if run and (cue or trimmed) and len(run) <= 8:
+            out.append((" ".join(run), m.group(1) if m else None))
+        i = j
+    return out
+
+
+def keywords(desc):
+    """描述 → {(关键词, 是否带版本)}"""
+    kws = set()
+    for m in WP_PLUGIN.finditer(desc or ""):
+        kws.add((m.group(1).lower(), False))
+    for phrase, ver in product_phrases(desc or ""):
+        words = phrase.lower().split()
+        cands = {" ".join(words)}
+        if len(words) > 1:
+            cands.add(words[-1])
+        for kw in cands:
+            if len(kw) < MIN_LEN or kw in GENERIC or not re.search(r"[a-z]", kw):
+                continue
+            kws.add((kw, False))
+            if ver:                                # banner 里常见的 "nginx/1.18.0"、"nginx 1.18.0"
+                kws.add((f"{kw}/{ver.lower()}", True))
+                kws.add((f"{kw} {ver.lower()}", True))
+    return kws
+
+
+def build_automaton(vuln_db=VULN_DB):
+    """vuln 表 → 关键词 → [CVE]，编译成自动机；返回 (自动机, 关键词数)"""
+    kw_cves = defaultdict(set)
+    conn = sqlite3.connect(vuln_db)
+    for cve, desc in conn.execute("SELECT cve, description FROM vuln WHERE description IS NOT NULL"):
+        for kw in keywords(desc):
+            kw_cves[kw].add(cve)
+    conn.close()
+
+    A = Automaton()
+    for (kw, exact), cves in kw_cves.items():
+        A.add_word(kw, (len(kw), kw, exact, tuple(sorted(cves))))
+    if kw_cves:
+        A.make_automaton()
+    return A, len(kw_cves)
+
+
+# ---------- CPE 版本区间索引 ----------
+VERSION_PARTS = 10
+PRERELEASE = {"alpha", "a", "beta", "b", "rc", "pre", "preview", "dev", "snapshot", "m", "ea"}
+BANNER_VERSION = re.compile(r"\b([a-z][a-z0-9+_.-]*?)[/:_ ]v?(\d+(?:\.\d+)+[a-z0-9.-]*)")
+# banner 里的叫法 → CPE 的 product 名
+ALIASES = {
+    "apache": ("http_server",),
+    "httpd": ("http_server",),
+    "microsoft-iis": ("internet_information_services",),
+    "iis": ("internet_information_services",),
+    "apache-coyote": ("tomcat",),
+    "jetty": ("jetty",),
 }
 
-results = []
-for row in cur.execute("SELECT ip,port,banner FROM assets"):
-    ip, port, banner = row
-    keywords = [k for k in banner_map if k in banner.lower()]
-    for kw in keywords:
-        for cve in banner_map[kw]:
-            results.append({"ip": ip, "port": port, "banner": banner, "cve": cve})
 
-with open(OUT, "w", encoding="utf-8") as f:
-    json.dump(results, f, indent=2, ensure_ascii=False)
+def version_key(v):
+    """"1.18.0" / "8.2p1" / "2.0-rc1" → 可比较的元组：数字段按数值比，缺的段按 0 补齐（1.0 == 1.0.0），
+    rc / beta 等预发布段排在正式版之前，其余字母段（如 8.2p1、1.0.2k）排在之后"""
+    parts = re.findall(r"\d+|[a-z]+", v.lower())
+    key = [(1, int(p)) if p.isdigit() else ((-1, p) if p in PRERELEASE else (2, p)) for p in parts]
+    return tuple(key + [(1, 0)] * (VERSION_PARTS - len(key)))
+
+
+class VersionIndex:
+    """单个 (vendor, product) 的区间索引：所有端点排序后切成基本段，每段预存覆盖它的 CVE，
+    查询只做一次 bisect。槽 2i 是 bounds[i] 之前的开区间，2i+1 是 bounds[i] 这个点"""
+
+    def __init__(self, ranges):
+        bounds = sorted({k for lo, _, hi, _, _ in ranges for k in (lo, hi) if k is not None})
+        pos = {b: i for i, b in enumerate(bounds)}
+        n = 2 * len(bounds) + 1
+        add, rem = {}, {}
+        for lo, lo_incl, hi, hi_incl, cve in ranges:
+            a = 0 if lo is None else 2 * pos[lo] + (1 if lo_incl else 2)
+            b = n - 1 if hi is None else 2 * pos[hi] + (1 if hi_incl else 0)
+            if a <= b:
+                add.setdefault(a, []).append(cve)
+                rem.setdefault(b + 1, []).append(cve)
+        cur, snap, self.slots = Counter(), (), []
+        for i in range(n):
+            if i in add or i in rem:
+                cur.update(add.get(i, ()))
+                cur.subtract(rem.get(i, ()))
+                snap = tuple(sorted(c for c, k in cur.items() if k > 0))   # 相邻段相同则共用一个元组
+            self.slots.append(snap)
+        self.bounds = bounds
+
+    def lookup(self, key):
+        i = bisect_left(self.bounds, key)
+        return self.slots[2 * i + 1 if i < len(self.bounds) and self.bounds[i] == key else 2 * i]
+
+
+class CpeIndex:
+    """cpe_match 表上的查询层：按 (vendor, product) 懒加载区间索引，只为 banner 里真正出现的产品建索引"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.ok = bool(conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='cpe_match'").fetchone())
+        self._index, self._products, self._cve_products = {}, {}, {}
+
+    def products(self, name):
+        """banner 里的产品名 → [(vendor, product)]"""
+        if name not in self._products:
+            cands = ALIASES.get(name, ()) + (name, name.replace("-", "_"))
+            marks = ",".join("?" * len(cands))
+            self._products[name] = self.conn.execute(
+                f"SELECT DISTINCT vendor, product FROM cpe_match WHERE product IN ({marks})", cands).fetchall()
+        return self._products[name]
+
+    def index(self, vp):
+        if vp not in self._index:
+            rows = self.conn.execute(
+                "SELECT version_start, start_incl, version_end, end_incl, cve FROM cpe_match "
+                "WHERE vendor = ? AND product = ?", vp)
+            self._index[vp] = VersionIndex([(version_key(lo) if lo else None, li,
+                                             version_key(hi) if hi else None, hi_, cve)
+                                            for lo, li, hi, hi_, cve in rows])
+        return self._index[vp]
+
+    def cve_products(self, cve):
+        if cve not in self._cve_products:
+            self._cve_products[cve] = {tuple(r) for r in self.conn.execute(
+                "SELECT DISTINCT vendor, product FROM cpe_match WHERE cve = ?", (cve,))}
+        return self._cve_products[cve]
+
+    def resolve(self, text):
+        """文本里的「产品/版本」→ ({cve: "产品/版本"}, 出现过版本号的 {(vendor, product)})"""
+        hits, seen = {}, set()
+        if not self.ok:
+            return hits, seen
+        for name, ver in BANNER_VERSION.findall(text):
+            for vp in self.products(name):
+                seen.add(vp)
+                for cve in self.index(vp).lookup(version_key(ver)):
+                    hits.setdefault(cve, f"{name}/{ver}")
+        return hits, seen
+
+
+# ---------- 匹配 ----------
+def bounded(text, start, end):
+    """关键词两侧不能紧挨字母数字，避免 "tomcat/9.0.3" 命中 "tomcat/9.0.31" 这类子串"""
+    before = text[start - 1] if start > 0 else " "
+    after = text[end + 1: end + 3]
+    if before.isalnum() or after[:1].isalnum():
+        return False
+    return not (after[:1] == "." and after[1:2].isdigit())
+
+
+def match(A, text):
+    """一条文本 → {cve: (关键词, 是否精确到版本)}，同一 CVE 优先保留带版本的命中"""
+    hits = {}
+    for end, (n, kw, exact, cves) in A.iter(text):
+        if not bounded(text, end - n + 1, end):
+            continue
+        for cve in cves:
+            if cve not in hits or (exact and not hits[cve][1]):
+                hits[cve] = (kw, exact)
+    return hits
+
+
+def init_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS asset_cves(
+            ip TEXT,
+            port TEXT,
+            cve TEXT,
+            keyword TEXT,
+            exact INTEGER,              -- 1 = 命中「产品/版本」，0 = 只命中产品名
+            first_seen TEXT,
+            last_seen TEXT,
+            UNIQUE(ip, port, cve)
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_asset_cves_cve ON asset_cves(cve)")
+
+
+UPSERT_SQL = """
+    INSERT INTO asset_cves(ip, port, cve, keyword, exact, first_seen, last_seen) VALUES (?,?,?,?,?,?,?)
+    ON CONFLICT(ip, port, cve) DO UPDATE SET
+        keyword = excluded.keyword, exact = excluded.exact, last_seen = excluded.last_seen
+"""
+
+
+def enrich_text(A, cpe, text):
+    """产品名命中 + CPE 版本区间命中；版本已知的产品，只认区间命中的 CVE"""
+    hits = match(A, text) if len(A) else {}
+    cpe_hits, seen = cpe.resolve(text)
+    if seen:
+        hits = {c: h for c, h in hits.items() if c in cpe_hits or not seen & cpe.cve_products(c)}
+    for cve, kw in cpe_hits.items():
+        hits[cve] = (kw, True)
+    return hits
+
+
+def enrich(conn, A, cpe, chunk=CHUNK):
+    """assets 按 chunk 条一批流式匹配并 upsert；返回 (扫描资产数, 关联条数)"""
+    now = time.strftime("%F %T")
+    read = conn.execute("SELECT ip, port, COALESCE(title, ''), COALESCE(banner, '') FROM assets")
+    scanned = linked = 0
+    while True:
+        rows = read.fetchmany(chunk)
+        if not rows:
+            break
+        batch = []
+        for ip, port, title, banner in rows:
+            text = f"{title}\n{banner}".lower()
+            for cve, (kw, exact) in enrich_text(A, cpe, text).items():
+                batch.append((ip, port, cve, kw, int(exact), now, now))
+        conn.executemany(UPSERT_SQL, batch)
+        scanned += len(rows)
+        linked += len(batch)
+    # 本轮没命中的旧关联（banner 变了或字典更新了）一并删除
+    conn.execute("DELETE FROM asset_cves WHERE last_seen < ?", (now,))
+    conn.commit()
+    return scanned, linked
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunk", type=int, default=CHUNK, help="每批从 assets 读取的行数")
+    ap.add_argument("--lookup", help="查询某个「产品/版本」受影响的 CVE，如 nginx/1.18.0")
+    args = ap.parse_args()
+
+    cpe = CpeIndex(sqlite3.connect(VULN_DB))
+    if args.lookup:
+        if not cpe.ok:
+            print("❌ vuln.db 里没有 cpe_match 表，先跑一遍 cve_nvd 爬虫")
+            return
+        hits, seen = cpe.resolve(args.lookup.lower())
+        print(f"{args.lookup} → {', '.join(f'{v}:{p}' for v, p in sorted(seen)) or '未知产品'}")
+        for cve in sorted(hits):
+            print(f"  {cve}")
+        return
+
+    t0 = time.time()
+    A, n_kw = build_automaton()
+    print(f"🔧 关键词 {n_kw} 个（{'pyahocorasick' if ahocorasick else '纯 Python'} 自动机），"
+          f"构建用时 {time.time() - t0:.1f}s")
+
+    conn = sqlite3.connect(DB)
+    init_table(conn)
+    t0 = time.time()
+    scanned, linked = enrich(conn, A, cpe, args.chunk) if n_kw or cpe.ok else (0, 0)
+    conn.close()
+    print(f"✅ 扫描资产 {scanned} 条，写入 {linked} 条 CVE 关联 → asset_cves，用时 {time.time() - t0:.1f}s")
+
 
-print(f"✅ 已补全 {len(results)} 条 CVE 关联 → {OUT}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,142 @@
 #!/usr/bin/env python3
-import json, requests, os, datetime
+"""
+tools/notify.py  -- 新漏洞推送（飞书机器人 webhook）
+以 intel.db 中 vulns 表的自增 id 作高水位，只推上次推送之后新增的漏洞，按 severity + 模板汇总成一条消息；
+推送成功才前移高水位，失败的下次重发
+用法：python tools/notify.py [--webhook URL]          # 推一次
+      python tools/notify.py --watch                  # 常驻：首条新漏洞出现后攒 window_seconds 再合并推送
+"""
+import argparse, datetime, sqlite3, time, yaml, requests
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-ROOT = Path(__file__).parent
-vuln_json = ROOT / "clean" / "final_vulns.json"
-webhook = "https://open.feishu.cn/open-apis/bot/v2/hook/你的token"
+ROOT = Path(__file__).parent.parent
+cfg = yaml.safe_load(open(ROOT / "config.yaml", encoding="utf-8"))
+ncfg = cfg.get("notify") or {}
+DB = ROOT / cfg["sqlite"]["db"]
 
-def push():
-    if not vuln_json.exists():
+SEV_ORDER = ["critical", "high", "medium", "low", "info", "unknown"]
+TOP_TEMPLATES = 5          # 每个级别最多列出的模板数
+
+
+def make_session(retries=4):
+    """复用连接；429 / 5xx 与连接错误按 1s、2s、4s… 退避重试"""
+    s = requests.Session()
+    retry = Retry(total=retries, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset({"POST"}))
+    adapter = HTTPAdapter(max_retries=retry)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def init_state(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS notify_state(key TEXT PRIMARY KEY, value INTEGER)")
+
+
+def high_water(conn):
+    row = conn.execute("SELECT value FROM notify_state WHERE key='vulns'").fetchone()
+    return row[0] if row else 0
+
+
+def set_high_water(conn, value):
+    conn.execute("INSERT INTO notify_state(key, value) VALUES ('vulns', ?) "
+                 "ON CONFLICT(key) DO UPDATE SET value=excluded.value", (value,))
+    conn.commit()
+
+
+def latest_id(conn):
+    return conn.execute("SELECT MAX(id) FROM vulns").fetchone()[0] or 0
+
+
+def summarise(conn, lo, hi):
+    """(lo, hi] 区间内新增漏洞 → 汇总文本；聚合在 SQL 里做，区间再大也只返回分组行"""
+    groups = {}
+    for sev, tid, n in conn.execute(
+            "SELECT LOWER(COALESCE(severity, 'unknown')), template_id, COUNT(*) FROM vulns "
+            "WHERE id > ? AND id <= ? GROUP BY 1, 2 ORDER BY 3 DESC", (lo, hi)):
+        groups.setdefault(sev, []).append((tid, n))
+
+    total = sum(n for g in groups.values() for _, n in g)
+    lines = [f"🚨 {datetime.datetime.now():%m-%d %H:%M} 新增 {total} 条漏洞"]
+    for sev in sorted(groups, key=lambda s: SEV_ORDER.index(s) if s in SEV_ORDER else len(SEV_ORDER)):
+        tmpls = groups[sev]
+        shown = "、".join(f"{tid} ×{n}" for tid, n in tmpls[:TOP_TEMPLATES])
+        more = f" 等 {len(tmpls)} 个模板" if len(tmpls) > TOP_TEMPLATES else ""
+        lines.append(f"{sev.upper()} {sum(n for _, n in tmpls)}：{shown}{more}")
+    return "\n".join(lines)
+
+
+def send(session, webhook, text):
+    resp = session.post(webhook, json={"msg_type": "text", "content": {"text": text}}, timeout=10)
+    resp.raise_for_status()
+    # 飞书 / 钉钉 业务错误也是 HTTP 200，错误码在响应体里
+    try:
+        body = resp.json()
+    except ValueError:
+        return
+    code = body.get("code", body.get("errcode", 0)) if isinstance(body, dict) else 0
+    if code:
+        raise requests.HTTPError(f"webhook 返回错误：{body}")
+
+
+def push(conn, session, webhook):
+    """推送高水位之后的新增漏洞，返回推送条数（0 表示没有新漏洞或推送失败）"""
+    lo, hi = high_water(conn), latest_id(conn)
+    if hi <= lo:
+        return 0
+    text = summarise(conn, lo, hi)
+    if not webhook:
+        print(f"⚠️ 未配置 notify.webhook，仅打印：\n{text}")
+        return 0
+    try:
+        send(session, webhook, text)
+    except requests.RequestException as e:
+        print(f"❌ 推送失败，下次重试：{e}")
+        return 0
+    set_high_water(conn, hi)
+    return hi - lo
+
+
+def watch(conn, session, webhook, window, poll):
+    """首条新漏洞出现时开窗，窗口内陆续入库的漏洞合并成一条消息"""
+    opened = None
+    while True:
+        if latest_id(conn) > high_water(conn):
+            opened = opened or time.monotonic()
+            if time.monotonic() - opened >= window:
+                if push(conn, session, webhook):
+                    opened = None
+        time.sleep(poll)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--webhook", default=ncfg.get("webhook"), help="覆盖 config.yaml 的 notify.webhook")
+    ap.add_argument("--watch", action="store_true", help="常驻模式，按时间窗合并推送")
+    ap.add_argument("--window", type=float, default=ncfg.get("window_seconds", 300))
+    ap.add_argument("--poll", type=float, default=ncfg.get("poll_seconds", 30))
+    args = ap.parse_args()
+
+    if args.watch and not args.webhook:
+        # 没有 webhook 时 push 不前移高水位，窗口一到就会每轮重复打印同一条汇总
+        print("❌ --watch 需要 webhook，请配置 notify.webhook 或传 --webhook")
         return
-    with open(vuln_json, encoding="utf-8") as f:
-        vulns = json.load(f)
-    if not vulns:
+
+    conn = sqlite3.connect(DB)
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='vulns'").fetchone():
+        print("❌ intel.db 中没有 vulns 表，请先运行 poc-framework/main.py")
         return
-    msg = {
-        "msg_type": "text",
-        "content": {
-            "text": f"🚨 {datetime.datetime.now():%m-%d %H:%M} 发现 {len(vulns)} 条新漏洞"
-        }
-    }
-    requests.post(webhook, json=msg, timeout=5)
+    init_state(conn)
+    session = make_session(ncfg.get("retries", 4))
+    if args.watch:
+        watch(conn, session, args.webhook, args.window, args.poll)
+    else:
+        n = push(conn, session, args.webhook)
+        if n:
+            print(f"✅ 已推送 {n} 条新漏洞")
+
 
 if __name__ == "__main__":
-    push()
\ No newline at end of file
+    main()
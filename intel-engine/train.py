@@ -1,69 +1,20 @@
 #!/usr/bin/env python3
 # train_v2.py
-import json, random, pathlib as pl, numpy as np
+import argparse, hashlib, importlib.util, json, random, time, pathlib as pl, numpy as np
 import torch, torch.nn.functional as F
 from torch_geometric.nn import GCNConv
 from sklearn.metrics import roc_auc_score
+from graph_features import load_graph, to_data, save_vocab
+from export_gnn import export
 
 SEED = 42
 random.seed(SEED); np.random.seed(SEED); torch.manual_seed(SEED)
 
 ROOT = pl.Path(__file__).parent / "clean"
+JSON_FILE = ROOT / "final_vulns.json"
+MODEL_META = ROOT / "risk_gnn_meta.json"     # 模型版本（权重哈希）：predict.py --incremental 的指纹以它为盐
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-# ---------- utils ----------
-def load_json(fp):
-    raw = json.load(open(fp, encoding="utf-8"))
-    return json.loads(raw) if isinstance(raw, str) else (raw if isinstance(raw, list) else [raw])
-
-def ip_subnet(ip):   # 10.0.123.45 -> 10.0.123
-    return '.'.join(ip.split('.')[:3])
-
-# ---------- build graph ----------
-def build_graph(root_dir):
-    import networkx as nx
-    records = [r for fp in root_dir.glob("final_vulns.json") for r in load_json(fp)]
-
-    ip_info, template_set = {}, set()
-    for r in records:
-        host   = (r.get("host") or r.get("matched-at") or "0.0.0.0:0") if isinstance(r, dict) else str(r)
-        ip     = host.split(":")[0]
-        port   = int(host.split(":")[1]) if ":" in host else random.randint(8000, 9000)
-        sev    = r.get("severity","unknown").lower() if isinstance(r, dict) else "unknown"
-        risk_score   = r.get("info",{}).get("classification",{}).get("risk-score", random.randint(0,9)) if isinstance(r, dict) else random.randint(0,9)
-        template = r.get("template-id", "unknown") if isinstance(r, dict) else "unknown"
-        template_set.add(template)
-        ip_info[ip] = {"sev": sev, "risk-score": risk_score, "port": port, "template": template}
-
-    # 编码
-    sev2id   = {s:i for i,s in enumerate(["critical","high","medium","low","info","unknown"])}
-    tmpl2id  = {t:i for i,t in enumerate(sorted(template_set))}
-
-    G = nx.Graph()
-    for ip, info in ip_info.items():
-        sev_emb   = sev2id[info["sev"]]
-        tmpl_emb  = tmpl2id[info["template"]]
-        # 特征：risk-score, port/10000, sev_embed, tmpl_embed
-        feat = [float(info["risk-score"]), info["port"]/65535.0, float(sev_emb), float(tmpl_emb)]
-        label = 1 if info["sev"] in {"critical","high"} else 0
-        G.add_node(ip, x=feat, y=label)
-
-    # 边：同 /24 子网互联，稀疏且带结构
-    subnets = {}
-    for ip in G.nodes:
-        subnets.setdefault(ip_subnet(ip), []).append(ip)
-    for ip_list in subnets.values():
-        if len(ip_list) >= 2:
-            for i in range(len(ip_list)):
-                for j in range(i+1, len(ip_list)):
-                    G.add_edge(ip_list[i], ip_list[j])
-
-    from torch_geometric.utils import from_networkx
-    data = from_networkx(G)
-    data.x = torch.tensor(list(nx.get_node_attributes(G, "x").values()), dtype=torch.float)
-    data.y = torch.tensor(list(nx.get_node_attributes(G, "y").values()), dtype=torch.long)
-    return data
-
 # ---------- model ----------
 class GNN(torch.nn.Module):
     def __init__(self, in_dim=4, hid=64, out=2, drop=0.5):
@@ -80,10 +31,110 @@ class GNN(torch.nn.Module):
         x = F.dropout(x, p=self.drop, training=self.training)
         return self.conv3(x, edge_index)
 
+# ---------- 训练 ----------
+def evaluate(model, data, val_idx):
+    model.eval()
+    with torch.no_grad():
+        pred = F.softmax(model(data.x, data.edge_index)[val_idx], 1)[:, 1]
+    return roc_auc_score(data.y[val_idx].cpu(), pred.cpu())
+
+def train_full(model, opt, data, train_idx, val_idx, epochs):
+    """全图训练：小图默认走这里"""
+    data = data.to(DEVICE)
+    for epoch in range(1, epochs + 1):
+        model.train()
+        out = model(data.x, data.edge_index)[train_idx]
+        loss = F.cross_entropy(out, data.y[train_idx])
+        opt.zero_grad(); loss.backward(); opt.step()
+
+        if epoch % 20 == 0 or epoch == 1:
+            auc = evaluate(model, data, val_idx)
+            print(f"Epoch {epoch:03d} | loss={loss:.4f} | val_AUC={auc:.4f}")
+
+def evaluate_sampled(model, loader):
+    model.eval()
+    preds, labels = [], []
+    with torch.no_grad():
+        for batch in loader:
+            batch = batch.to(DEVICE)
+            out = model(batch.x, batch.edge_index)[:batch.batch_size]
+            preds.append(F.softmax(out, 1)[:, 1].cpu())
+            labels.append(batch.y[:batch.batch_size].cpu())
+    return roc_auc_score(torch.cat(labels), torch.cat(preds))
+
+def train_sampled(model, opt, data, train_idx, val_idx, epochs, fanout, batch_size, workers):
+    """邻居采样 mini-batch 训练：每层最多 fanout[i] 个邻居，显存/内存只和 batch 大小有关。
+    NeighborLoader 依赖 pyg-lib 或 torch-sparse"""
+    if not any(importlib.util.find_spec(m) for m in ("pyg_lib", "torch_sparse")):
+        raise SystemExit("❌ --sampled 需要 pyg-lib 或 torch-sparse，请按 torch / CUDA 版本安装：\n"
+                         "   pip install pyg-lib -f https://data.pyg.org/whl/torch-${TORCH}+${CUDA}.html")
+    from torch_geometric.loader import NeighborLoader
+    kw = dict(num_neighbors=fanout, batch_size=batch_size,
+              num_workers=workers, persistent_workers=workers > 0)
+    train_loader = NeighborLoader(data, input_nodes=train_idx, shuffle=True, **kw)
+    val_loader   = NeighborLoader(data, input_nodes=val_idx, shuffle=False, **kw)
+
+    for epoch in range(1, epochs + 1):
+        model.train()
+        total, seen = 0.0, 0
+        for batch in train_loader:
+            batch = batch.to(DEVICE)
+            # 只有前 batch_size 个是种子节点，其余是采样来的邻居
+            out = model(batch.x, batch.edge_index)[:batch.batch_size]
+            loss = F.cross_entropy(out, batch.y[:batch.batch_size])
+            opt.zero_grad(); loss.backward(); opt.step()
+            total += loss.item() * batch.batch_size
+            seen  += batch.batch_size
+
+        if epoch % 20 == 0 or epoch == 1:
+            auc = evaluate_sampled(model, val_loader)
+            print(f"Epoch {epoch:03d} | loss={total / max(seen, 1):.4f} | val_AUC={auc:.4f}")
+
 # ---------- main ----------
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--epochs", type=int, default=400)
+    ap.add_argument("--sampled", action="store_true", help="邻居采样 mini-batch 训练（百万节点级大图）")
+    ap.add_argument("--fanout", default="15,10,5", help="每层采样邻居数上限，层数与 GCN 层数一致")
+    ap.add_argument("--batch-size", type=int, default=1024)
+    ap.add_argument("--workers", type=int, default=0, help="采样 DataLoader 进程数")
+    ap.add_argument("--force", action="store_true", help="不管模型新旧都重新训练")
+    ap.add_argument("--max-age-days", type=float, default=7, help="模型超过这么多天才定期重训")
+    ap.add_argument("--drift", type=float, default=0.2, help="节点数相对上次训练变化超过该比例时重训")
+    return ap.parse_args()
+
+def retrain_reason(g, args, meta):
+    """返回重训原因，None 表示沿用现有模型。
+    模型一变所有节点的指纹都失效、要全量重算，所以日常新增几台主机不重训，只按周期或图规模漂移重训"""
+    if args.force:
+        return "--force"
+    if not meta or not (ROOT / "risk_gnn_final.pt").exists():
+        return "尚无模型"
+    age = (time.time() - meta.get("trained_ts", 0)) / 86400
+    if age > args.max_age_days:
+        return f"模型已 {age:.1f} 天未更新"
+    n, old = len(g["nodes"]), meta.get("nodes") or 0
+    if abs(n - old) > args.drift * max(old, 1):
+        return f"节点数 {old} → {n}，超过漂移阈值 {args.drift:.0%}"
+    return None
+
+def load_meta():
+    try:
+        return json.loads(MODEL_META.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
 def main():
-    data = build_graph(ROOT).to(DEVICE)
-    print("节点数:", data.num_nodes, "正样本比例:", data.y.float().mean().item())
+    args = parse_args()
+    g = load_graph(JSON_FILE)          # 同一份 final_vulns.json 直接命中缓存
+    meta = load_meta()
+    reason = retrain_reason(g, args, meta)
+    if reason is None:
+        print(f"✅ 沿用现有模型 {meta.get('version')}（训练于 {meta.get('trained_at')}，--force 强制重训）")
+        return
+    print(f"🔁 重新训练：{reason}")
+    data = to_data(g)
+    print("节点数:", data.num_nodes, "边数:", data.num_edges, "正样本比例:", data.y.float().mean().item())
 
     from sklearn.model_selection import train_test_split
 
@@ -91,28 +142,29 @@ def main():
     train_idx, val_idx = train_test_split(
         idx,
         test_size=0.2,
-        stratify=data.y.cpu(),      # 保持正负比例
+        stratify=data.y,            # 保持正负比例
         random_state=42
     )
 
     model = GNN().to(DEVICE)
     opt = torch.optim.Adam(model.parameters(), lr=1e-4)
 
-    for epoch in range(1, 401):
-        model.train()
-        out = model(data.x, data.edge_index)[train_idx]
-        loss = F.cross_entropy(out, data.y[train_idx])
-        opt.zero_grad(); loss.backward(); opt.step()
-
-        if epoch % 20 == 0 or epoch == 1:
-            model.eval()
-            with torch.no_grad():
-                pred = F.softmax(model(data.x, data.edge_index)[val_idx], 1)[:, 1]
-                auc = roc_auc_score(data.y[val_idx].cpu(), pred.cpu())
-                print(f"Epoch {epoch:03d} | loss={loss:.4f} | val_AUC={auc:.4f}")
+    if args.sampled:
+        fanout = [int(k) for k in args.fanout.split(",")]
+        if len(fanout) != 3:
+            raise SystemExit("--fanout 需要 3 个值，对应 3 层 GCNConv")
+        train_sampled(model, opt, data, train_idx, val_idx, args.epochs, fanout, args.batch_size, args.workers)
+    else:
+        train_full(model, opt, data, train_idx, val_idx, args.epochs)
 
     torch.save(model.state_dict(), ROOT / "risk_gnn_final.pt")
+    save_vocab(g["vocab"])             # 推理沿用训练词表
+    # 版本只取决于训练出的权重：不重训就不变，增量打分只重算变化节点的邻域
+    version = hashlib.blake2b((ROOT / "risk_gnn_final.pt").read_bytes(), digest_size=8).hexdigest()
+    MODEL_META.write_text(json.dumps({"version": version, "nodes": data.num_nodes, "trained_ts": time.time(),
+                                      "trained_at": time.strftime("%F %T")}, indent=2), encoding="utf-8")
     print("✅ 训练完成")
+    export()                           # 导出 TorchScript 推理模型
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,8 +1,9 @@
 # vuln_graph.py  (方案 B 完整版)
-import json, torch, ipaddress
-import networkx as nx
+import json, sys, torch
+import numpy as np
 from torch_geometric.data import Data
 from pathlib import Path
+from graph_features import pack_ipv4, subnet_edges
 
 ROOT = Path(__file__).parent
 JSON_PATH = ROOT / "clean" / "final_vulns.json"
@@ -11,55 +12,38 @@ JSON_PATH = ROOT / "clean" / "final_vulns.json"
 SEV2IDX = {"unknown": 0, "info": 1, "low": 2, "medium": 3, "high": 4, "critical": 5}
 
 
-def build_graph() -> Data | None:
+def build_graph(prefix: int = 24) -> Data | None:
     if not JSON_PATH.exists():
         return None
 
     with open(JSON_PATH, encoding="utf-8") as f:
         vulns = json.load(f)
 
-    G = nx.Graph()  # 无向图即可
-
-    # 1. 建节点
+    # 1. 建节点：按 IP 首次出现排序，同一 IP 取最后一条的 severity
+    sev = {}
     for v in vulns:
         host = v.get("host") or v.get("matched-at", "-")
-        sev  = v.get("severity", "unknown").lower()
         # 提取纯 IP（去掉端口）
         ip = host.split(":")[0] if ":" in host else host
-        G.add_node(ip, sev_idx=SEV2IDX[sev])
+        sev[ip] = SEV2IDX[v.get("severity", "unknown").lower()]
 
-    if len(G) == 0:
+    if not sev:
         return None
+    n = len(sev)
 
     # 2. 建边
     # 2-a 自环
-    for n in G.nodes:
-        G.add_edge(n, n)
-
-    # 2-b 同 /24 网段边
-    nodes = list(G.nodes)
-    for i, a in enumerate(nodes):
-        for j, b in enumerate(nodes):
-            if i >= j:  # 避免重复
-                continue
-            try:
-                net_a = ipaddress.ip_network(f"{a}/24", strict=False)
-                net_b = ipaddress.ip_network(f"{b}/24", strict=False)
-                if net_a == net_b:
-                    G.add_edge(a, b)
-            except ValueError:
-                continue  # 非 IP 跳过
+    loops = np.arange(n, dtype=np.int64)
+    # 2-b 同前缀网段边（非 IPv4 节点只有自环）
+    pairs = subnet_edges(pack_ipv4(sev), prefix)
 
     # 3. 转 tensor
-    node2id = {ip: idx for idx, ip in enumerate(G.nodes)}
-    x = torch.tensor([[G.nodes[n]["sev_idx"]] for n in G.nodes], dtype=torch.float)
-
-    edges = [(node2id[u], node2id[v]) for u, v in G.edges]
-    edge_index = torch.tensor(edges, dtype=torch.long).t().contiguous()
+    x = torch.tensor(list(sev.values()), dtype=torch.float).unsqueeze(1)
+    edge_index = torch.from_numpy(np.concatenate([np.stack([loops, loops]), pairs], axis=1))
 
     return Data(x=x, edge_index=edge_index)
 
 
 if __name__ == "__main__":
-    g = build_graph()
-    print(g)
\ No newline at end of file
+    g = build_graph(int(sys.argv[1]) if len(sys.argv) > 1 else 24)
+    print(g)